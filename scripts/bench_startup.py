@@ -0,0 +1,118 @@
+"""
+Benchmark of the startup of the bot, with and without lean mode.
+
+Each mode runs in its own process and logs in with the token of bot.conf. The script measures the time until on_ready,
+the resident memory once the bot is ready and after a settle period, and the number of gateway events received
+during that period. The bot doesn't run its on_ready routine (no cog, no interview resume, no reconciliation).
+
+usage: poetry run python scripts/bench_startup.py [--settle 60]
+"""
+import argparse
+import asyncio
+import json
+import resource
+import subprocess
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.main import Config, DiscordBot  # noqa: E402
+
+
+def rss_mib() -> float:
+    """
+    Get the resident memory of the process.
+    :return: the memory in MiB
+    """
+    try:
+        with open("/proc/self/status") as file:
+            for line in file:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # peak memory, in KiB on linux and in bytes on macos
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+class BenchBot(DiscordBot):
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, enable_debug_events=True, **kwargs)
+        self.ready = asyncio.Event()
+        self.events: Counter[str] = Counter()
+
+    async def on_ready(self) -> None:
+        self.ready.set()
+
+    async def on_socket_event_type(self, event_type: str) -> None:
+        self.events[event_type] += 1
+
+
+async def measure(lean: bool, settle: float) -> Dict[str, Any]:
+    """
+    Start the bot, wait for it to be ready and to settle, then stop it.
+    :param lean: whether lean mode is enabled
+    :param settle: time to wait once the bot is ready, in seconds
+    :return: the measures
+    """
+    config = Config()
+    config.config["lean_mode"] = lean
+    start = time.perf_counter()
+    bot = BenchBot(help_command=None, config=config)
+    task = asyncio.ensure_future(bot.start(config["token"]))
+    await bot.ready.wait()
+    ready_time = time.perf_counter() - start
+    rss_ready = rss_mib()
+
+    bot.events.clear()
+    await asyncio.sleep(settle)
+    rss_settled = rss_mib()
+    events = dict(bot.events)
+    cached_members = sum(len(guild.members) for guild in bot.guilds)
+
+    await bot.close()
+    await task
+    return {
+        "lean_mode": lean,
+        "time_to_ready_s": round(ready_time, 3),
+        "rss_ready_mib": round(rss_ready, 1),
+        "rss_settled_mib": round(rss_settled, 1),
+        "cached_members": cached_members,
+        "events_during_settle": sum(events.values()),
+        "events_by_type": events,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--settle", type=float, default=60, help="time to wait once the bot is ready, in seconds")
+    parser.add_argument("--mode", choices=["full", "lean"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode is not None:
+        print(json.dumps(asyncio.run(measure(args.mode == "lean", args.settle))))
+        return
+
+    # a fresh process per mode, so the memory of one run doesn't leak into the other
+    results = []
+    for mode in ["full", "lean"]:
+        output = subprocess.run([sys.executable, __file__, "--mode", mode, "--settle", str(args.settle)], capture_output=True, text=True, check=True)
+        results.append(json.loads(output.stdout.strip().splitlines()[-1]))
+
+    print(f"{'mode':<6} {'ready (s)':>10} {'rss ready (MiB)':>16} {'rss settled (MiB)':>18} {'members':>8} {'events':>8}")
+    for result in results:
+        print(
+            f"{'lean' if result['lean_mode'] else 'full':<6} {result['time_to_ready_s']:>10} {result['rss_ready_mib']:>16} {result['rss_settled_mib']:>18} "
+            f"{result['cached_members']:>8} {result['events_during_settle']:>8}"
+        )
+    for result in results:
+        print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Test of the bulk review commands, against the in-process fake of discord of the load test.
+
+Pending applications are posted in the fake pending channel, next to an embed that isn't an application and to the
+embed of an application the bot has no record of. !approve_many is run on all of them: the bad messages must be
+reported as failures, and every valid application must still be approved, written to the disk and whitelisted. The
+script exits with an error at the first check that fails.
+
+usage: poetry run python scripts/bulk_test.py
+"""
+import asyncio
+import logging
+import sys
+import tempfile
+import time
+import types
+from pathlib import Path
+from typing import Any, List
+
+import discord
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from scripts.load_test import FakeChannel, FakeMessage, FakeUser, build_bot  # noqa: E402
+
+from src.application import Application, Status  # noqa: E402
+
+applications = 12
+
+
+async def run(data_dir: Path) -> None:
+    bot, channels = build_bot(data_dir, discord_latency=0.001)
+    pending: FakeChannel = channels[bot.config["pending_app"]]
+    staff = FakeUser(1_000, "staff", 0.001)
+    bot.add_user(staff)
+
+    message_ids = []
+    for i in range(applications):
+        user = FakeUser(20_000 + 10 * i, f"Player{i}", 0.001)
+        bot.add_user(user)
+        record = Application(Status.PENDING, author_name=user.name, author_id=user.id, name=user.name, uuid=f"{i:032x}", timestamps={"submitted": time.time()})
+        bot.whitelist[user.id] = record
+        await bot.send_pending(bot.make_application_embed_pending(record), user.id)
+        message_ids.append(bot.whitelist[user.id].pending_message_id)
+
+    # an embed that isn't an application, and the application of a user the bot has no record of
+    not_an_application = await pending.send(embed=discord.Embed(title="rules", description="not an application"))
+    orphan = Application(Status.PENDING, author_name="ghost", author_id=99_990, name="Ghost", uuid="f" * 32)
+    orphan_message = await pending.send(embed=bot.make_application_embed_pending(orphan))
+    bad_ids = [not_an_application.id, orphan_message.id]
+    selection = [str(message_id) for message_id in message_ids[:6] + bad_ids + message_ids[6:]]
+
+    progress: List[FakeMessage] = []
+
+    async def send(content: str = "", **kwargs: Any) -> FakeMessage:
+        message = await pending.send(content)
+        progress.append(message)
+        return message
+
+    ctx = types.SimpleNamespace(send=send, author=staff)
+    await bot.commands_cog.process_many(ctx, tuple(selection), reason_message=None)  # type: ignore
+
+    approved = [str(20_000 + 10 * i) for i in range(applications)]
+    assert all(bot.whitelist.status(key) == Status.APPROVED for key in approved), "some applications weren't approved"
+    on_disk = bot.whitelist.store.read().result()
+    assert all(on_disk[key]["status"] == Status.APPROVED.value for key in approved), "the approvals weren't written to the disk"
+    queued = sorted(bot.console.pending.values())
+    assert queued == sorted(f"Player{i}" for i in range(applications)), f"the whitelist commands weren't queued: {queued}"
+    report = progress[-1].content
+    assert "done" in report and all(str(message_id) in report for message_id in bad_ids), f"the failures weren't reported: {report}"
+    await bot.close()
+
+
+def main() -> None:
+    logging.disable(logging.CRITICAL)
+    with tempfile.TemporaryDirectory() as data_dir:
+        asyncio.run(run(Path(data_dir)))
+    print("the bulk approval of a mixed selection passed")
+
+
+if __name__ == "__main__":
+    main()
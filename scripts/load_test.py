@@ -0,0 +1,436 @@
+"""
+Load test of the interview and review flows, against an in-process fake of discord and of Mojang's API.
+
+N applicants go through the interview with random typing delays, while M staff members review the applications
+posted in the pending channel. The script reports the throughput, the latency of each step, the peak memory and the
+number of API calls, and saves them as JSON so runs can be compared between commits. All the files of the bot are
+written in a temporary directory.
+
+usage: poetry run python scripts/load_test.py --applicants 500 --reviewers 5 --output results.json
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import types
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import discord
+import numpy as np
+from aiohttp import web
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.command_cog import CommandsCog, white_check_mark, x  # noqa: E402
+from src.main import Config, DiscordBot  # noqa: E402
+from src.perf import metrics  # noqa: E402
+
+# the steps of the interview, in order, with the answer of the applicants
+steps = ["name", "age", "read rules", "punishment", "ban", "referal", "personality"]
+answers = ["{name}", "20", "yes", "yes", "no never next", "a friend told me next", "I code. I hike. I cook a lot. next"]
+
+# discord api calls made by the bot, by kind
+api_calls: Counter[str] = Counter()
+
+
+class FakeMessage:
+    _next_id = 1000
+
+    def __init__(self, channel: Any, author: Any, content: Optional[str] = None, embed: Optional[discord.Embed] = None) -> None:
+        FakeMessage._next_id += 1
+        self.id: int = FakeMessage._next_id
+        self.channel = channel
+        self.guild = getattr(channel, "guild", None)
+        self.author = author
+        self.content: str = content or ""
+        self.embeds: List[discord.Embed] = [embed] if embed is not None else []
+        self.reactions: List[Any] = []
+
+    async def delete(self, delay: Optional[float] = None) -> None:
+        api_calls["message.delete"] += 1
+        if delay is None:
+            await asyncio.sleep(self.channel.latency())
+        self.channel.messages.pop(self.id, None)
+
+    async def add_reaction(self, emoji: Any) -> None:
+        api_calls["message.add_reaction"] += 1
+        await asyncio.sleep(self.channel.latency())
+
+    async def remove_reaction(self, emoji: Any, member: Any) -> None:
+        api_calls["message.remove_reaction"] += 1
+        await asyncio.sleep(self.channel.latency())
+
+    async def edit(self, content: Optional[str] = None, **kwargs: Any) -> None:
+        api_calls["message.edit"] += 1
+        await asyncio.sleep(self.channel.latency())
+        self.content = content or self.content
+
+
+class FakeChannel:
+    """
+    A channel of the guild, or a DM channel. Every API call waits for a random latency.
+    """
+
+    def __init__(self, channel_id: int, guild: Any, latency: float, kind: str) -> None:
+        self.id: int = channel_id
+        self.guild = guild
+        self.mean_latency: float = latency
+        self.kind: str = kind
+        self.messages: Dict[int, FakeMessage] = dict()
+        # the messages with an embed, for the reviewers
+        self.embeds: "asyncio.Queue[FakeMessage]" = asyncio.Queue()
+        # set when the bot sends a message, for the applicants
+        self.received = asyncio.Event()
+        self.last_content: str = ""
+
+    def latency(self) -> float:
+        return random.uniform(0.5, 1.5) * self.mean_latency
+
+    async def send(self, content: Optional[str] = None, embed: Optional[discord.Embed] = None, **kwargs: Any) -> FakeMessage:
+        api_calls[f"{self.kind}.send"] += 1
+        await asyncio.sleep(self.latency())
+        message = FakeMessage(self, None, content, embed)
+        self.messages[message.id] = message
+        self.last_content = content or ""
+        self.received.set()
+        if embed is not None:
+            self.embeds.put_nowait(message)
+        return message
+
+    async def fetch_message(self, message_id: int) -> FakeMessage:
+        api_calls[f"{self.kind}.fetch_message"] += 1
+        await asyncio.sleep(self.latency())
+        return self.messages[message_id]
+
+    def get_partial_message(self, message_id: int) -> FakeMessage:
+        return self.messages.get(message_id) or FakeMessage(self, None)
+
+
+class FakeUser:
+    def __init__(self, user_id: int, name: str, latency: float) -> None:
+        self.id: int = user_id
+        self.name: str = name
+        self.display_name: str = name
+        self.discriminator: str = "0"
+        self.avatar = None
+        self.bot: bool = False
+        self.dm_channel = FakeChannel(user_id + 1, None, latency, "dm")
+
+    async def create_dm(self) -> FakeChannel:
+        return self.dm_channel
+
+    def __eq__(self, other: Any) -> bool:
+        return getattr(other, "id", None) == self.id
+
+    def __hash__(self) -> int:
+        return self.id
+
+
+class LoadTestBot(DiscordBot):
+    def __init__(self, guild: Any, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.fake_guild = guild
+
+    def get_guild(self, guild_id: int) -> Any:
+        return self.fake_guild
+
+    def add_user(self, user: FakeUser) -> None:
+        # the user cache of discord.py, read by get_user
+        self._connection._users[user.id] = user  # type: ignore
+
+    async def fetch_user(self, user_id: int) -> Any:
+        api_calls["fetch_user"] += 1
+        return self.get_user(user_id)
+
+
+def start_fake_mojang(latency: float, counter: Counter[str]) -> web.Application:
+    """
+    Fake of Mojang's API: every name is a valid account, except the ones starting with "unknown".
+    :param latency: mean latency of the requests, in seconds
+    :param counter: counter of the requests
+    :return: the application
+    """
+
+    def profile(name: str) -> Dict[str, str]:
+        return {"id": hashlib.md5(name.lower().encode()).hexdigest(), "name": name}
+
+    async def batch(request: web.Request) -> web.Response:
+        counter["mojang.batch"] += 1
+        await asyncio.sleep(random.uniform(0.5, 1.5) * latency)
+        names = await request.json()
+        return web.json_response([profile(name) for name in names if not name.lower().startswith("unknown")])
+
+    async def single(request: web.Request) -> web.Response:
+        counter["mojang.single"] += 1
+        await asyncio.sleep(random.uniform(0.5, 1.5) * latency)
+        name = request.match_info["name"]
+        if name.lower().startswith("unknown"):
+            return web.Response(status=204)
+        return web.json_response(profile(name))
+
+    app = web.Application()
+    app.router.add_post("/profiles/minecraft", batch)
+    app.router.add_get("/users/profiles/minecraft/{name}", single)
+    return app
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if len(values) == 0:
+        return {"count": 0}
+    p50, p90, p99 = np.percentile(values, [50, 90, 99]).tolist()
+    return {"count": len(values), "p50": round(p50, 4), "p90": round(p90, 4), "p99": round(p99, 4), "max": round(max(values), 4)}
+
+
+class LoadTest:
+    def __init__(self, bot: LoadTestBot, args: argparse.Namespace, pending: FakeChannel) -> None:
+        self.bot = bot
+        self.args = args
+        self.pending = pending
+        self.step_latency: Dict[str, List[float]] = defaultdict(list)
+        self.queue_wait: List[float] = []
+        self.interview_duration: List[float] = []
+        self.review_latency: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Counter[str] = Counter()
+        self.submitted = 0
+        self.reviewed = 0
+        self.applicants_done = asyncio.Event()
+
+    async def wait_for_bot(self, channel: FakeChannel) -> str:
+        """
+        Wait for the next message of the bot in a DM channel.
+        :param channel: the channel
+        :return: the content of the message
+        """
+        await asyncio.wait_for(channel.received.wait(), timeout=self.args.step_timeout)
+        channel.received.clear()
+        return channel.last_content
+
+    async def applicant(self, user: FakeUser, delay: float) -> None:
+        await asyncio.sleep(delay)
+        loop = asyncio.get_running_loop()
+        channel = user.dm_channel
+        start = loop.time()
+        interview = asyncio.ensure_future(self.bot.on_message(FakeMessage(channel, user, "hi")))  # type: ignore
+        try:
+            # the queue position updates come first, if the interviews are full
+            while "in the queue" in await self.wait_for_bot(channel):
+                pass
+            self.queue_wait.append(loop.time() - start)
+
+            for step, answer in zip(steps, answers):
+                await asyncio.sleep(random.expovariate(1 / self.args.typing_delay))
+                answered = loop.time()
+                await self.bot.on_message(FakeMessage(channel, user, answer.format(name=user.name)))  # type: ignore
+                await self.wait_for_bot(channel)
+                self.step_latency[step].append(loop.time() - answered)
+            await asyncio.wait_for(interview, timeout=self.args.step_timeout)
+            self.interview_duration.append(loop.time() - start)
+            self.submitted += 1
+        except Exception as e:
+            self.errors[type(e).__name__] += 1
+            interview.cancel()
+
+    async def reviewer(self, staff: FakeUser) -> None:
+        loop = asyncio.get_running_loop()
+        ctx_message = FakeMessage(self.pending, staff, "!app_reason")
+        while not (self.applicants_done.is_set() and self.pending.embeds.empty()):
+            try:
+                message = await asyncio.wait_for(self.pending.embeds.get(), timeout=0.5)
+            except asyncio.TimeoutError:
+                continue
+            await asyncio.sleep(random.expovariate(1 / self.args.review_delay))
+            approve = random.random() < self.args.approval_rate
+            event = types.SimpleNamespace(
+                channel_id=self.pending.id,
+                guild_id=self.pending.guild.id,
+                message_id=message.id,
+                member=staff,
+                emoji=white_check_mark if approve else x,
+            )
+            start = loop.time()
+            try:
+                await self.bot.commands_cog._reaction_listener(event)  # type: ignore
+                if approve:
+                    self.review_latency["approve"].append(loop.time() - start)
+                else:
+                    ctx = types.SimpleNamespace(message=ctx_message, send=self.pending.send, author=staff)
+                    start = loop.time()
+                    cog: Any = self.bot.commands_cog
+                    await cog._app_rejection.callback(cog, ctx, str(self.pending.guild.id), str(self.pending.id), str(message.id), "load", "test")
+                    self.review_latency["reject"].append(loop.time() - start)
+                self.reviewed += 1
+            except Exception as e:
+                self.errors[f"review {type(e).__name__}"] += 1
+
+
+async def monitor_loop_lag(samples: List[float], interval: float = 0.05) -> None:
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(time.perf_counter() - start - interval)
+
+
+def build_bot(data_dir: Path, discord_latency: float, **overrides: Any) -> Tuple[LoadTestBot, Dict[int, FakeChannel]]:
+    """
+    Build a bot using data_dir for its files, connected to a fake guild instead of discord.
+    :param data_dir: the directory of the files of the bot
+    :param discord_latency: mean latency of the fake discord api calls, in seconds
+    :param overrides: config entries overriding the default config
+    :return: the bot, and the channels of the guild by id
+    """
+    # the config is completed with its default values, then overridden
+    conf_path = data_dir / "bot.conf"
+    if not conf_path.exists():
+        conf_path.write_text(json.dumps({"token": "load-test", "guild_id": 1}))
+    logging.disable(logging.WARNING)
+    config = Config(conf_path)
+    logging.disable(logging.NOTSET)
+    config.config.update(data_dir=str(data_dir), log_level="WARNING", log_levels={}, **overrides)
+
+    guild = types.SimpleNamespace(id=1)
+    channels = {
+        channel_id: FakeChannel(channel_id, guild, discord_latency, kind)
+        for channel_id, kind in [
+            (config["pending_app"], "pending"),
+            (config["validated_app"], "validated"),
+            (config["rejected_app"], "rejected"),
+            *[(channel_id, "console") for channel_id in config["console channels"]],
+        ]
+    }
+    guild.get_channel = channels.get  # type: ignore
+
+    bot = LoadTestBot(guild, help_command=None, config=config)
+    bot.channels.resolve(bot)
+    # what on_ready would do, without connecting to discord
+    bot.commands_cog = CommandsCog(bot)
+    return bot, channels
+
+
+async def start_mojang(latency: float, counter: Counter[str]) -> Tuple[web.AppRunner, str]:
+    """
+    Start the fake of Mojang's API on a free port.
+    :param latency: mean latency of the requests, in seconds
+    :param counter: counter of the requests
+    :return: the runner of the server, and its url
+    """
+    runner = web.AppRunner(start_fake_mojang(latency, counter), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]  # type: ignore
+    return runner, f"http://127.0.0.1:{port}"
+
+
+async def run(args: argparse.Namespace, data_dir: Path) -> Dict[str, Any]:
+    random.seed(args.seed)
+    mojang_calls: Counter[str] = Counter()
+    runner, mojang_url = await start_mojang(args.mojang_latency, mojang_calls)
+
+    bot, channels = build_bot(
+        data_dir,
+        discord_latency=args.discord_latency,
+        mojang_api_url=mojang_url,
+        max_active_interviews=args.max_active,
+        perf_enabled=args.perf,
+    )
+    config = bot.config
+    bot.console.start()
+    test = LoadTest(bot, args, channels[config["pending_app"]])
+
+    applicants = [FakeUser(10_000 + 10 * i, f"Player{i}", args.discord_latency) for i in range(args.applicants)]
+    staff = [FakeUser(1_000 + 10 * i, f"staff{i}", args.discord_latency) for i in range(args.reviewers)]
+    for user in applicants + staff:
+        bot.add_user(user)
+
+    lag: List[float] = []
+    lag_monitor = asyncio.ensure_future(monitor_loop_lag(lag))
+    start = time.perf_counter()
+    reviewers = [asyncio.ensure_future(test.reviewer(member)) for member in staff]
+    await asyncio.gather(*[test.applicant(user, random.uniform(0, args.ramp)) for user in applicants])
+    interviews_done = time.perf_counter() - start
+    test.applicants_done.set()
+    await asyncio.gather(*reviewers)
+    duration = time.perf_counter() - start
+    lag_monitor.cancel()
+
+    await bot.console.stop()
+    perf = {"histograms": metrics.summary()} if args.perf else None
+    await bot.close()
+    await runner.cleanup()
+
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {
+        "duration_s": round(duration, 3),
+        "interviews_duration_s": round(interviews_done, 3),
+        "applications_submitted": test.submitted,
+        "applications_reviewed": test.reviewed,
+        "throughput": {
+            "submitted_per_s": round(test.submitted / interviews_done, 3),
+            "reviewed_per_s": round(test.reviewed / duration, 3),
+        },
+        "latency_s": {
+            "queue_wait": percentiles(test.queue_wait),
+            "interview": percentiles(test.interview_duration),
+            **{f"step {step}": percentiles(test.step_latency[step]) for step in steps},
+            **{f"review {kind}": percentiles(values) for kind, values in test.review_latency.items()},
+            "loop_lag": percentiles(lag),
+        },
+        "peak_rss_mib": round(maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1),
+        "api_calls": dict(sorted((api_calls + mojang_calls).items())),
+        "errors": dict(test.errors),
+        "perf": perf,
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True, cwd=Path(__file__).parent).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--applicants", type=int, default=200, help="number of simulated applicants")
+    parser.add_argument("--reviewers", type=int, default=3, help="number of simulated staff members")
+    parser.add_argument("--ramp", type=float, default=10, help="the applicants arrive uniformly over this time, in seconds")
+    parser.add_argument("--typing-delay", type=float, default=1, help="mean time an applicant takes to answer, in seconds")
+    parser.add_argument("--review-delay", type=float, default=0.2, help="mean time a staff member takes to review, in seconds")
+    parser.add_argument("--approval-rate", type=float, default=0.8, help="share of the applications approved")
+    parser.add_argument("--discord-latency", type=float, default=0.05, help="mean latency of the discord api calls, in seconds")
+    parser.add_argument("--mojang-latency", type=float, default=0.1, help="mean latency of Mojang's api, in seconds")
+    parser.add_argument("--max-active", type=int, default=50, help="max_active_interviews of the bot")
+    parser.add_argument("--step-timeout", type=float, default=120, help="time after which an applicant gives up, in seconds")
+    parser.add_argument("--perf", action="store_true", help="enable the metrics of the bot and include them in the results")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, help="path of the JSON results")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        results = asyncio.run(run(args, Path(data_dir)))
+    report = {
+        "commit": git_commit(),
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "parameters": {k: str(v) for k, v in vars(args).items()},
+        "results": results,
+    }
+
+    print(json.dumps({key: value for key, value in results.items() if key != "perf"}, indent=2))
+    if results["perf"] is not None:
+        print(results["perf"]["histograms"])
+    if args.output is not None:
+        args.output.write_text(json.dumps(report, indent=2))
+        print(f"results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Restart test of the interviews, against the in-process fake of discord and of Mojang's API of the load test.
+
+For each step of the interview, an applicant answers up to that step, then the bot is dropped as if it was killed:
+nothing is closed nor compacted, so the records and the checkpoints only exist in the journals. A new bot is started on
+the same data directory. The resumed interview must be at the same step with the answers given so far, and the
+application must be complete once the applicant answers the remaining questions. The script exits with an error at the
+first scenario that fails.
+
+usage: poetry run python scripts/restart_test.py
+"""
+import asyncio
+import json
+import logging
+import sys
+import tempfile
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, Set
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from scripts.load_test import FakeChannel, FakeMessage, FakeUser, answers, build_bot, start_mojang, steps  # noqa: E402
+
+from src.application import Status  # noqa: E402
+
+step_timeout = 10
+# what the fake applicant answers, once typed by the bot
+expected_answers: Dict[str, Any] = {
+    "age": 20,
+    "read rules": True,
+    "punishment": True,
+    "ban": "no never ",
+    "referal": "a friend told me ",
+    "personality": "I code. I hike. I cook a lot. ",
+}
+
+
+async def wait_for_bot(channel: FakeChannel) -> str:
+    await asyncio.wait_for(channel.received.wait(), timeout=step_timeout)
+    channel.received.clear()
+    return channel.last_content
+
+
+async def answer(bot: Any, user: FakeUser, step: int) -> None:
+    await bot.on_message(FakeMessage(user.dm_channel, user, answers[step].format(name=user.name)))
+    await wait_for_bot(user.dm_channel)
+
+
+async def crash(bot: Any) -> None:
+    """
+    Drop a bot like a killed process: the lines already handed to the writer threads reach the journals, but the stores
+    are neither compacted nor closed.
+    :param bot: the bot
+    :return: None
+    """
+    bot.whitelist.store.flush()
+    bot.sessions.store.flush()
+    # only the http session of the client, which would be reported as leaked otherwise
+    await bot.mojang.close()
+
+
+def journal_keys(path: Path) -> Set[str]:
+    return {json.loads(line)["key"] for line in path.read_text().splitlines() if line} if path.exists() else set()
+
+
+def snapshot_keys(path: Path) -> Set[str]:
+    return set(json.loads(path.read_text())) if path.exists() else set()
+
+
+async def scenario(data_dir: Path, mojang_url: str, stop_at: int) -> None:
+    """
+    Stop the bot after the applicant answered stop_at steps, restart it and finish the interview.
+    :param data_dir: an empty directory for the files of the bots
+    :param mojang_url: the url of the fake of Mojang's API
+    :param stop_at: the number of steps answered before the restart
+    :return: None
+    """
+    bot, _ = build_bot(data_dir, discord_latency=0.001, mojang_api_url=mojang_url)
+    user = FakeUser(42_000, "Player42", 0.001)
+    bot.add_user(user)
+
+    interview = asyncio.ensure_future(bot.on_message(FakeMessage(user.dm_channel, user, "hi")))  # type: ignore
+    await wait_for_bot(user.dm_channel)
+    for step in range(stop_at):
+        await answer(bot, user, step)
+    session = bot.live_sessions.get(user.id)
+    assert session is not None and session.step == stop_at, f"the interview should be at step {stop_at} before the restart"
+
+    # the process is killed in the middle of the interview
+    interview.cancel()
+    await asyncio.gather(interview, return_exceptions=True)
+    await crash(bot)
+    key = str(user.id)
+    for name in ("whitelisted_players", "sessions"):
+        assert key in journal_keys(data_dir / f"{name}.journal"), f"the {name} journal doesn't have the interview"
+        assert key not in snapshot_keys(data_dir / f"{name}.json"), f"the {name} snapshot was written, the recovery wouldn't use the journal"
+
+    bot, channels = build_bot(data_dir, discord_latency=0.001, mojang_api_url=mojang_url)
+    user = FakeUser(user.id, user.name, 0.001)
+    bot.add_user(user)
+    assert bot.whitelist.status(user.id) == Status.PENDING, "the application wasn't recovered from the journal"
+    await bot.resume_interviews()
+    await wait_for_bot(user.dm_channel)
+
+    session = bot.live_sessions.get(user.id)
+    assert session is not None, "the interview wasn't resumed"
+    assert session.step == stop_at, f"the interview resumed at step {session.step} instead of {stop_at}"
+    given = {name: expected_answers[name] for name in steps[1:stop_at]}
+    assert session.record.answers == given, f"the answers given before the restart were lost: {session.record.answers} != {given}"
+    if stop_at > 0:
+        assert session.record.name == user.name, "the minecraft name given before the restart was lost"
+
+    for step in range(stop_at, len(steps)):
+        await answer(bot, user, step)
+    pending: FakeChannel = channels[bot.config["pending_app"]]
+    await asyncio.wait_for(pending.embeds.get(), timeout=step_timeout)
+
+    record = bot.whitelist[user.id]
+    assert record.status == Status.PENDING and record.submitted_at is not None, "the application wasn't submitted"
+    assert record.name == user.name and record.answers == expected_answers, f"the application is incomplete: {record!r}"
+    assert user.id not in bot.live_sessions, "the session is still live after the interview"
+    await bot.close()
+
+
+async def run() -> None:
+    runner, mojang_url = await start_mojang(0.001, Counter())
+    try:
+        for stop_at in range(len(steps)):
+            with tempfile.TemporaryDirectory() as data_dir:
+                await scenario(Path(data_dir), mojang_url, stop_at)
+            print(f"restart after {stop_at} steps: ok")
+    finally:
+        await runner.cleanup()
+
+
+def main() -> None:
+    logging.disable(logging.WARNING)
+    asyncio.run(run())
+    print("all the restart scenarios passed")
+
+
+if __name__ == "__main__":
+    main()
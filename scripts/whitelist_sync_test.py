@@ -0,0 +1,78 @@
+"""
+Test of the sync of the whitelist.json files with the approved applications.
+
+An entry added by hand must survive both a rebuild and the incremental updates, even when its player has a pending
+or rejected application, while the entries written by the bot are revoked once their application isn't approved
+anymore, including after a restart. The script exits with an error at the first check that fails.
+
+usage: poetry run python scripts/whitelist_sync_test.py
+"""
+import json
+import sys
+import tempfile
+from pathlib import Path
+from typing import Dict
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.application import Application, Status  # noqa: E402
+from src.whitelist_sync import WhitelistSync, dashed_uuid  # noqa: E402
+
+hand_uuid = "a" * 32
+approved_uuid = "b" * 32
+
+
+def record(status: Status, uuid: str, name: str) -> Application:
+    return Application(status, name=name, uuid=uuid)
+
+
+def read(path: Path) -> Dict[str, str]:
+    return {entry["uuid"]: entry["name"] for entry in json.loads(path.read_text())}
+
+
+def run(data_dir: Path) -> None:
+    whitelist = data_dir / "whitelist.json"
+    state = data_dir / "whitelist_sync.json"
+    # the staff whitelisted a player by hand, who also has a rejected application
+    whitelist.write_text(json.dumps([{"uuid": dashed_uuid(hand_uuid), "name": "Staff"}]))
+    records = {"1": record(Status.REJECTED, hand_uuid, "Staff"), "2": record(Status.APPROVED, approved_uuid, "Player")}
+
+    sync = WhitelistSync([whitelist], state)
+    sync.rebuild(records)
+    sync.close()
+    content = read(whitelist)
+    assert dashed_uuid(hand_uuid) in content, "the rebuild removed an entry added by hand"
+    assert dashed_uuid(approved_uuid) in content, "the rebuild didn't add the approved player"
+
+    # the incremental path leaves the hand entry alone too, and revokes the entries of the bot
+    sync = WhitelistSync([whitelist], state)
+    sync.rebuild(records)
+    sync.track("1", record(Status.PENDING, hand_uuid, "Staff"))
+    sync.track("2", record(Status.BLOCKED, approved_uuid, "Player"))
+    sync.close()
+    content = read(whitelist)
+    assert dashed_uuid(hand_uuid) in content, "an update removed an entry added by hand"
+    assert dashed_uuid(approved_uuid) not in content, "an update didn't revoke a blocked player"
+
+    # an entry written by the bot before a restart is revoked by the rebuild once the application isn't approved
+    records["2"] = record(Status.APPROVED, approved_uuid, "Player")
+    sync = WhitelistSync([whitelist], state)
+    sync.rebuild(records)
+    sync.close()
+    records["2"] = record(Status.REJECTED, approved_uuid, "Player")
+    sync = WhitelistSync([whitelist], state)
+    sync.rebuild(records)
+    sync.close()
+    content = read(whitelist)
+    assert dashed_uuid(approved_uuid) not in content, "the rebuild didn't revoke an entry written by the bot before the restart"
+    assert dashed_uuid(hand_uuid) in content, "the rebuild removed an entry added by hand after the restart"
+
+
+def main() -> None:
+    with tempfile.TemporaryDirectory() as data_dir:
+        run(Path(data_dir))
+    print("the whitelist sync scenarios passed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+import asyncio
+from collections import OrderedDict
+from typing import Awaitable, Callable, Set
+
+
+class AdmissionController:
+    """
+    Caps the number of interviews running at the same time. The users over the cap wait in a FIFO queue, and are
+    admitted as soon as a slot frees up.
+    """
+
+    def __init__(self, max_active: int, update_interval: float) -> None:
+        self.max_active: int = max_active
+        self.update_interval: float = update_interval
+        self.active: Set[int] = set()
+        self.waiting: OrderedDict[int, asyncio.Future[None]] = OrderedDict()
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self.active or user_id in self.waiting
+
+    def position(self, user_id: int) -> int:
+        """
+        Get the position of a user in the queue.
+        :param user_id: the id of the user
+        :return: the position, starting at 1, or 0 if the user isn't waiting
+        """
+        for position, waiting_id in enumerate(self.waiting, start=1):
+            if waiting_id == user_id:
+                return position
+        return 0
+
+    def admit(self, user_id: int) -> None:
+        """
+        Give a slot to a user without going through the queue, e.g. for an interview resumed after a restart.
+        :param user_id: the id of the user
+        :return: None
+        """
+        self.active.add(user_id)
+
+    async def acquire(self, user_id: int, notify: Callable[[int], Awaitable[object]]) -> None:
+        """
+        Wait for a free slot. While waiting, the user is told about their position in the queue, at most once per
+        update interval and only if it changed.
+        :param user_id: the id of the user
+        :param notify: coroutine function called with the position of the user in the queue
+        :return: None
+        """
+        if len(self.active) < self.max_active and len(self.waiting) == 0:
+            self.active.add(user_id)
+            return
+
+        future: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+        self.waiting[user_id] = future
+        last_position = 0
+        try:
+            while True:
+                # release() may have granted the slot while the wait below was timing out
+                if future.done():
+                    return
+                position = self.position(user_id)
+                if position != last_position:
+                    last_position = position
+                    await notify(position)
+                try:
+                    await asyncio.wait_for(asyncio.shield(future), timeout=self.update_interval)
+                    return
+                except asyncio.TimeoutError:
+                    continue
+        except BaseException:
+            # give the slot back if it was granted while we were being cancelled
+            if self.waiting.pop(user_id, None) is None:
+                self.release(user_id)
+            raise
+
+    def release(self, user_id: int) -> None:
+        """
+        Free the slot of a user, and admit the next users in the queue.
+        :param user_id: the id of the user
+        :return: None
+        """
+        self.active.discard(user_id)
+        while len(self.active) < self.max_active and len(self.waiting) > 0:
+            next_id, future = self.waiting.popitem(last=False)
+            self.active.add(next_id)
+            future.set_result(None)
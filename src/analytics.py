@@ -0,0 +1,196 @@
+import time
+from typing import Any, Dict, List
+
+import numpy as np
+
+from src.application import Application
+
+statuses = ["pending", "approved", "rejected", "blocked"]
+# rolling windows of the review outcomes, in days
+windows = [7, 30, 90]
+
+
+class ApplicationColumns:
+    """
+    The applications as columns of numpy arrays, one row per application. A missing timestamp is NaN, a missing
+    reviewer is -1.
+
+    The rows are kept up to date as the records change: set() writes the row of a record, and remove() clears it so it
+    doesn't count anymore. The cleared rows are reused.
+    """
+
+    def __init__(self, capacity: int = 1024) -> None:
+        # discord id -> row
+        self.rows: Dict[str, int] = dict()
+        self.free: List[int] = []
+        # the rows in use are all below size
+        self.size: int = 0
+        self.status = np.full(capacity, -1, dtype=np.int8)
+        self.started = np.full(capacity, np.nan)
+        self.admitted = np.full(capacity, np.nan)
+        self.submitted = np.full(capacity, np.nan)
+        self.reviewed = np.full(capacity, np.nan)
+        self.reviewer = np.full(capacity, -1, dtype=np.int32)
+        self.reviewer_codes: Dict[str, int] = dict()
+
+    @classmethod
+    def from_records(cls, records: Dict[str, Application]) -> "ApplicationColumns":
+        columns = cls(capacity=max(len(records), 1024))
+        for key, record in records.items():
+            columns.set(key, record)
+        return columns
+
+    @property
+    def reviewers(self) -> List[str]:
+        return list(self.reviewer_codes)
+
+    def grow(self) -> None:
+        capacity = 2 * len(self.status)
+        for name, fill in (("status", -1), ("started", np.nan), ("admitted", np.nan), ("submitted", np.nan), ("reviewed", np.nan), ("reviewer", -1)):
+            column = getattr(self, name)
+            grown = np.full(capacity, fill, dtype=column.dtype)
+            grown[: len(column)] = column
+            setattr(self, name, grown)
+
+    def set(self, key: str, record: Application) -> None:
+        """
+        Write the row of a record.
+        :param key: the discord id of the record
+        :param record: the record
+        :return: None
+        """
+        row = self.rows.get(key)
+        if row is None:
+            if len(self.free) > 0:
+                row = self.free.pop()
+            else:
+                if self.size == len(self.status):
+                    self.grow()
+                row = self.size
+                self.size += 1
+            self.rows[key] = row
+
+        status = record.status.value
+        self.status[row] = statuses.index(status)
+        timestamps = record.timestamps
+        self.started[row] = timestamps.get("started", np.nan)
+        self.admitted[row] = timestamps.get("admitted", np.nan)
+        submitted = record.submitted_at
+        self.submitted[row] = submitted if submitted is not None else np.nan
+        self.reviewed[row] = timestamps.get(status, np.nan) if status in ("approved", "rejected") else np.nan
+        self.reviewer[row] = self.reviewer_codes.setdefault(record.reviewer, len(self.reviewer_codes)) if record.reviewer is not None else -1
+
+    def remove(self, key: str) -> None:
+        """
+        Clear the row of a deleted record.
+        :param key: the discord id of the record
+        :return: None
+        """
+        row = self.rows.pop(key, None)
+        if row is None:
+            return
+        self.status[row] = -1
+        for column in (self.started, self.admitted, self.submitted, self.reviewed):
+            column[row] = np.nan
+        self.reviewer[row] = -1
+        self.free.append(row)
+
+    def copy(self) -> "ApplicationColumns":
+        """
+        Copy the rows in use, e.g. to analyze them on a worker thread while the records keep changing.
+        :return: the copy, without the discord ids
+        """
+        columns = ApplicationColumns(capacity=0)
+        columns.size = self.size
+        for name in ("status", "started", "admitted", "submitted", "reviewed", "reviewer"):
+            setattr(columns, name, getattr(self, name)[: self.size].copy())
+        columns.reviewer_codes = dict(self.reviewer_codes)
+        return columns
+
+    def is_status(self, status: str) -> np.ndarray:
+        mask: np.ndarray = self.status[: self.size] == statuses.index(status)
+        return mask
+
+
+def describe(durations: np.ndarray) -> Dict[str, float]:
+    """
+    Summarize some durations.
+    :param durations: the durations in seconds, NaN for the unknown ones
+    :return: the count, and the median, 90th and 99th percentiles in seconds
+    """
+    durations = durations[np.isfinite(durations)]
+    if len(durations) == 0:
+        return {"count": 0}
+    p50, p90, p99 = np.percentile(durations, [50, 90, 99]).tolist()
+    return {"count": len(durations), "p50": p50, "p90": p90, "p99": p99}
+
+
+def format_duration(seconds: float) -> str:
+    if seconds < 3600:
+        return f"{seconds / 60:.0f}m"
+    if seconds < 48 * 3600:
+        return f"{seconds / 3600:.1f}h"
+    return f"{seconds / 86400:.1f}d"
+
+
+def queue_stats(columns: ApplicationColumns, now: float | None = None) -> Dict[str, Any]:
+    """
+    Compute the throughput and review latency statistics of the applications.
+    :param columns: the applications, as columns trimmed to their rows in use, as copy() returns them
+    :param now: the current timestamp
+    :return: the statistics
+    """
+    now = time.time() if now is None else now
+    pending = columns.is_status("pending") & np.isfinite(columns.submitted)
+    approved = columns.is_status("approved")
+    rejected = columns.is_status("rejected")
+
+    review_latency = columns.reviewed - columns.submitted
+    per_reviewer = {}
+    for code, reviewer in enumerate(columns.reviewers):
+        per_reviewer[reviewer] = describe(review_latency[columns.reviewer == code])
+
+    outcomes = {}
+    for days in windows:
+        recent = columns.reviewed >= now - days * 86400
+        approvals, rejections = int(np.sum(recent & approved)), int(np.sum(recent & rejected))
+        ratio = approvals / (approvals + rejections) if approvals + rejections > 0 else None
+        outcomes[f"{days}d"] = {"approved": approvals, "rejected": rejections, "approval_ratio": ratio}
+
+    return {
+        "counts": {status: int(np.sum(columns.is_status(status))) for status in statuses},
+        "queue_wait": describe(columns.admitted - columns.started),
+        "time_to_submit": describe(columns.submitted - columns.started),
+        "pending_age": describe(now - columns.submitted[pending]),
+        "review_latency": describe(review_latency),
+        "review_latency_per_reviewer": dict(sorted(per_reviewer.items(), key=lambda item: -item[1]["count"])),
+        "outcomes": outcomes,
+    }
+
+
+def format_queue_stats(stats: Dict[str, Any], reviewers: int = 10) -> str:
+    """
+    Format the statistics for discord.
+    :param stats: the statistics, as returned by queue_stats
+    :param reviewers: the number of staff members to show, the most active first
+    :return: the message
+    """
+
+    def line(name: str, summary: Dict[str, float]) -> str:
+        if summary["count"] == 0:
+            return f"{name}: no data"
+        return f"{name}: n={summary['count']}, " + ", ".join(f"{p} {format_duration(summary[p])}" for p in ("p50", "p90", "p99"))
+
+    lines = [", ".join(f"{status}: {count}" for status, count in stats["counts"].items()), ""]
+    lines.append(line("queue wait", stats["queue_wait"]))
+    lines.append(line("time to submit", stats["time_to_submit"]))
+    lines.append(line("pending age", stats["pending_age"]))
+    lines.append(line("review latency", stats["review_latency"]))
+    lines.append("")
+    for window, outcome in stats["outcomes"].items():
+        ratio = "-" if outcome["approval_ratio"] is None else f"{outcome['approval_ratio']:.0%}"
+        lines.append(f"last {window}: {outcome['approved']} approved, {outcome['rejected']} rejected, approval ratio {ratio}")
+    lines.append("")
+    lines.append("review latency per staff member:")
+    lines += [line(f"  {reviewer}", summary) for reviewer, summary in list(stats["review_latency_per_reviewer"].items())[:reviewers]]
+    return "```\n" + "\n".join(lines) + "\n```"
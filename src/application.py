@@ -0,0 +1,147 @@
+from enum import Enum
+from typing import Any, Dict, Optional
+
+from src.storage import parse_application_date
+
+
+class Status(str, Enum):
+    PENDING = "pending"
+    APPROVED = "approved"
+    REJECTED = "rejected"
+    BLOCKED = "blocked"
+
+    @property
+    def terminal(self) -> bool:
+        return self is not Status.PENDING
+
+
+def normalize_answer(value: Any) -> Any:
+    """
+    Convert an answer of the old records to its typed form: the integer questions used to store the list of numbers
+    found in the answer, as strings.
+    :param value: the answer, as read from the disk
+    :return: the answer
+    """
+    if isinstance(value, list) and len(value) == 1 and isinstance(value[0], str) and value[0].lstrip("-").isdigit():
+        return int(value[0])
+    return value
+
+
+class Application:
+    """
+    The record of an application. The author sub-dict of the json format is flattened, and the answers of the
+    questionnaire are kept in their own dict, under the names of the questions.
+
+    The on-disk format is unchanged: to_dict() and from_dict() convert from and to the json records.
+    """
+
+    __slots__ = (
+        "status",
+        "author_name",
+        "author_id",
+        "discriminator",
+        "name",
+        "uuid",
+        "answers",
+        "timestamps",
+        "reviewer",
+        "pending_message_id",
+        "blacklist_reason",
+        "date",
+    )
+
+    # the fields stored at the top level of the json records, the other keys are answers
+    fields = ("status", "name", "uuid", "timestamps", "reviewer", "pending_message_id", "blacklist_reason", "date")
+
+    def __init__(
+        self,
+        status: Status,
+        author_name: Optional[str] = None,
+        author_id: Optional[int] = None,
+        discriminator: Optional[str] = None,
+        name: Optional[str] = None,
+        uuid: Optional[str] = None,
+        answers: Optional[Dict[str, Any]] = None,
+        timestamps: Optional[Dict[str, float]] = None,
+        reviewer: Optional[str] = None,
+        pending_message_id: Optional[int] = None,
+        blacklist_reason: Optional[str] = None,
+        date: Optional[str] = None,
+    ) -> None:
+        self.status: Status = status
+        self.author_name: Optional[str] = author_name
+        self.author_id: Optional[int] = author_id
+        self.discriminator: Optional[str] = discriminator
+        self.name: Optional[str] = name
+        self.uuid: Optional[str] = uuid
+        self.answers: Dict[str, Any] = answers if answers is not None else dict()
+        self.timestamps: Dict[str, float] = timestamps if timestamps is not None else dict()
+        self.reviewer: Optional[str] = reviewer
+        self.pending_message_id: Optional[int] = pending_message_id
+        self.blacklist_reason: Optional[str] = blacklist_reason
+        # the formatted date of the applications made before the timestamps were recorded
+        self.date: Optional[str] = date
+
+    def __repr__(self) -> str:
+        return f"Application({self.to_dict()!r})"
+
+    @property
+    def submitted_at(self) -> Optional[float]:
+        """
+        The time the application was submitted at, None if it hasn't been submitted yet.
+        """
+        submitted = self.timestamps.get("submitted")
+        if submitted is not None:
+            return float(submitted)
+        return parse_application_date(self.date)
+
+    @property
+    def processed_at(self) -> Optional[float]:
+        """
+        The time the application was approved or rejected at, None if it hasn't been reviewed.
+        """
+        if self.status not in (Status.APPROVED, Status.REJECTED):
+            return None
+        processed = self.timestamps.get(self.status.value)
+        if processed is not None:
+            return float(processed)
+        # the applications reviewed before the timestamps were recorded only have the date they were made
+        return self.submitted_at
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Convert the record to its json form.
+        :return: the json record
+        """
+        data: Dict[str, Any] = {"status": self.status.value}
+        if self.author_id is not None:
+            data["author"] = {"name": self.author_name, "id": self.author_id, "discriminator": self.discriminator}
+        for field in Application.fields[1:]:
+            value = getattr(self, field)
+            if value is not None and value != {}:
+                data[field] = value
+        data.update(self.answers)
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Application":
+        """
+        Build a record from its json form.
+        :param data: the json record
+        :return: the record
+        """
+        author = data.get("author") or {}
+        return cls(
+            status=Status(data.get("status", "pending")),
+            author_name=author.get("name"),
+            author_id=author.get("id"),
+            discriminator=author.get("discriminator"),
+            name=data.get("name"),
+            uuid=data.get("uuid"),
+            answers={key: normalize_answer(value) for key, value in data.items() if key != "author" and key not in cls.fields},
+            timestamps=data.get("timestamps"),
+            reviewer=data.get("reviewer"),
+            pending_message_id=data.get("pending_message_id"),
+            blacklist_reason=data.get("blacklist_reason"),
+            date=data.get("date"),
+        )
@@ -0,0 +1,131 @@
+import datetime
+import gzip
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from src.storage import atomic_write_json
+
+logger = logging.getLogger("bot - archive")
+
+# discord id -> [status, partition, uuid, name]
+ArchiveIndex = Dict[str, List[Optional[str]]]
+
+
+def partition_of(timestamp: float) -> str:
+    """
+    Get the partition of the records processed at a given time.
+    :param timestamp: the time the record was processed at
+    :return: the month, as YYYY-MM
+    """
+    return datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc).strftime("%Y-%m")
+
+
+class Archive:
+    """
+    Cold tier of the records: the applications processed long ago, in gzipped ndjson files partitioned by the month
+    they were processed in (YYYY-MM.ndjson.gz). Each line has the same {"key", "value"} form as the journal.
+
+    An index of the archived discord ids, with the status, partition, uuid and name of their record, lets a record be
+    read without going through every partition, and the approved players stay whitelisted without reading the
+    partitions at all.
+
+    The partitions and the index are replaced atomically, so readers never see a partial write. The methods do blocking
+    disk IO and are meant to run on a worker thread, with a single writer at a time.
+    """
+
+    def __init__(self, directory: Path) -> None:
+        self.directory: Path = directory
+        self.index_path: Path = directory / "index.json"
+
+    def partition_path(self, partition: str) -> Path:
+        return self.directory / f"{partition}.ndjson.gz"
+
+    def partitions(self) -> List[str]:
+        """
+        Get the partitions of the archive.
+        :return: the months, most recent first
+        """
+        if not self.directory.exists():
+            return []
+        return sorted((path.name.removesuffix(".ndjson.gz") for path in self.directory.glob("*.ndjson.gz")), reverse=True)
+
+    def read_index(self) -> ArchiveIndex:
+        if not self.index_path.exists():
+            return dict()
+        with open(self.index_path, "r") as file:
+            index: ArchiveIndex = json.load(file)
+        return index
+
+    def read_partition(self, partition: str) -> Dict[str, Dict[str, Any]]:
+        """
+        Read the records of a partition.
+        :param partition: the month
+        :return: discord id -> json record
+        """
+        path = self.partition_path(partition)
+        records: Dict[str, Dict[str, Any]] = dict()
+        if not path.exists():
+            return records
+        with gzip.open(path, "rt") as file:
+            for line in file:
+                entry = json.loads(line)
+                records[entry["key"]] = entry["value"]
+        return records
+
+    def add(self, records: Dict[str, Tuple[str, Dict[str, Any]]]) -> None:
+        """
+        Add records to the archive, replacing the archived records with the same discord id.
+        :param records: discord id -> (partition, json record)
+        :return: None
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        by_partition: Dict[str, Dict[str, Dict[str, Any]]] = dict()
+        for key, (partition, data) in records.items():
+            by_partition.setdefault(partition, dict())[key] = data
+
+        for partition, added in by_partition.items():
+            content = self.read_partition(partition)
+            content.update(added)
+            path = self.partition_path(partition)
+            tmp_path = path.with_name(path.name + ".tmp")
+            with gzip.open(tmp_path, "wt") as file:
+                file.writelines(json.dumps({"key": key, "value": value}) + "\n" for key, value in content.items())
+            os.replace(tmp_path, path)
+
+        # the index is written last: after a crash, the records are still in the main store and get archived again
+        index = self.read_index()
+        for key, (partition, data) in records.items():
+            index[key] = [data.get("status"), partition, data.get("uuid"), data.get("name")]
+        atomic_write_json(self.index_path, index)
+        logger.info(f"archived {len(records)} records in {len(by_partition)} partitions")
+
+    def get(self, key: str, partition: str) -> Optional[Dict[str, Any]]:
+        """
+        Read an archived record.
+        :param key: the discord id
+        :param partition: the partition of the record, as found in the index
+        :return: the json record, or None if it isn't in the partition
+        """
+        return self.read_partition(partition).get(key)
+
+    def scan(self, predicate: Callable[[Dict[str, Any]], bool], since: Optional[float] = None) -> List[Tuple[str, Dict[str, Any]]]:
+        """
+        Search the archived records.
+        :param predicate: function telling if a json record matches
+        :param since: skip the partitions of the records processed before this timestamp
+        :return: a list of (discord id, json record), most recent partitions first
+        """
+        index = self.read_index()
+        oldest = partition_of(since) if since is not None else None
+        results = []
+        for partition in self.partitions():
+            if oldest is not None and partition < oldest:
+                break
+            for key, data in self.read_partition(partition).items():
+                # a record archived again later has a stale copy in an older partition
+                if key in index and index[key][1] == partition and predicate(data):
+                    results.append((key, data))
+        return results
@@ -0,0 +1,99 @@
+import logging
+from typing import Dict, List, Optional
+
+import discord
+
+logger = logging.getLogger("bot - channels")
+
+
+class ChannelNotFound(Exception):
+    """
+    Raised when a channel set in the config doesn't exist, or can't be seen by the bot.
+    """
+
+
+class ChannelResolver:
+    """
+    The channels set in the config, resolved once when the bot gets ready and kept up to date through the guild
+    channel events, so sending to them doesn't need any lookup.
+    """
+
+    def __init__(self, guild_id: int, channel_ids: Dict[str, List[int]]) -> None:
+        """
+        :param guild_id: the id of the guild
+        :param channel_ids: role of the channels (e.g. "pending_app") -> their ids
+        """
+        self.guild_id: int = guild_id
+        self.channel_ids: Dict[str, List[int]] = channel_ids
+        self.channels: Dict[int, Optional[discord.TextChannel]] = {channel_id: None for ids in channel_ids.values() for channel_id in ids}
+
+    def resolve(self, client: discord.Client) -> List[str]:
+        """
+        Look up all the channels.
+        :param client: the bot
+        :return: a description of the channels that couldn't be found
+        """
+        guild = client.get_guild(self.guild_id)
+        missing = []
+        for role, ids in self.channel_ids.items():
+            for channel_id in ids:
+                channel = guild.get_channel(channel_id) if guild is not None else None
+                self.channels[channel_id] = channel  # type: ignore
+                if channel is None:
+                    missing.append(f"{role} ({channel_id})")
+        return missing
+
+    def set(self, channel: discord.abc.GuildChannel) -> None:
+        """
+        Track a channel that was created or updated.
+        :param channel: the channel
+        :return: None
+        """
+        if channel.id in self.channels and channel.guild.id == self.guild_id:
+            self.channels[channel.id] = channel  # type: ignore
+
+    def remove(self, channel: discord.abc.GuildChannel) -> None:
+        """
+        Forget a channel that was deleted.
+        :param channel: the channel
+        :return: None
+        """
+        if channel.id in self.channels:
+            self.channels[channel.id] = None
+            logger.error(f"channel {channel.id} was deleted, but it is still set in the config")
+
+    def get_by_id(self, channel_id: int) -> discord.TextChannel:
+        """
+        Get a channel set in the config by its id.
+        :param channel_id: the id of the channel
+        :return: the channel
+        :raise ChannelNotFound: if the channel isn't set in the config or doesn't exist
+        """
+        channel = self.channels.get(channel_id)
+        if channel is None:
+            raise ChannelNotFound(f"channel {channel_id} is not a configured channel, or it doesn't exist anymore")
+        return channel
+
+    def get(self, role: str) -> discord.TextChannel:
+        """
+        Get the channel of a role.
+        :param role: the role of the channel, e.g. "pending_app"
+        :return: the channel
+        :raise ChannelNotFound: if the channel doesn't exist
+        """
+        return self.get_all(role)[0]
+
+    def get_all(self, role: str) -> List[discord.TextChannel]:
+        """
+        Get all the channels of a role.
+        :param role: the role of the channels, e.g. "console"
+        :return: the channels
+        :raise ChannelNotFound: if one of the channels doesn't exist
+        """
+        channels = []
+        for channel_id in self.channel_ids[role]:
+            channel = self.channels[channel_id]
+            if channel is None:
+                raise ChannelNotFound(f"the {role} channel ({channel_id}) doesn't exist or can't be seen by the bot. Check the config.")
+            channels.append(channel)
+        return channels
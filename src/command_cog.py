@@ -1,38 +1,54 @@
-import json
+import asyncio
+import datetime
 import logging
 import re
-from pathlib import Path
-from typing import Any, List
+import time
+from typing import Any, AsyncIterator, Awaitable, Dict, List, Optional, Set, Tuple
 
 import discord
-from discord import Embed, Member, Message, RawReactionActionEvent
+from discord import Embed, Member, Message, PartialMessage, RawReactionActionEvent, TextChannel
 from discord.ext.commands import Context
 from discord.ext.commands.bot import BotBase
 from discord.ext.commands.cog import Cog
 
-logging.basicConfig(filename=Path(__file__).parent.parent / "bot.log", filemode="a", format="%(asctime)s - %(levelname)s - %(name)s - %(message)s", level=logging.INFO)
+from src.analytics import format_queue_stats, queue_stats
+from src.application import Application, Status
+from src.log import bind
+from src.outbox import safify, split_message
+from src.perf import metrics
+from src.question import load_questions
+from src.stats import MemberRow, MemberStatsExport, format_summary
 
-logging.getLogger().addHandler(logging.StreamHandler())
 logger = logging.getLogger("bot - cog")
 
 white_check_mark = discord.PartialEmoji(name="✅")
 x = discord.PartialEmoji(name="❌")
 # radioactive = discord.PartialEmoji(name="☢")
 team_member_role_id = 733012839823966328
-stats_path = Path(__file__).parent.parent / "info.json"
+uuid_pattern = re.compile("^[0-9a-f]{32}$")
 
 
-def safify(msg: str) -> str:
-    return msg.replace("~", "\\~").replace("|", "\\|").replace("*", "\\*").replace("_", "\\_")
+async def iter_cached_members(guild: discord.Guild, chunk_size: int = 1000) -> AsyncIterator[Member]:
+    """
+    Iterate over the cached members of a guild, yielding to the event loop between chunks.
+    :param guild: the guild
+    :param chunk_size: the number of members between two yields
+    :return: the members
+    """
+    for i, member in enumerate(guild.members):
+        if i % chunk_size == 0:
+            await asyncio.sleep(0)
+        yield member
 
 
 class CommandsCog(Cog):
     def __init__(self, bot: Any):
         self.bot = bot
+        self.stats_export: asyncio.Future[None] | None = None
 
     @discord.ext.commands.command(name="app")
     async def _app(self, ctx: Context) -> None:
-        embed = self.bot.make_application_embed_pending(self.bot.whitelist[str(ctx.author.id)])
+        embed = self.bot.make_application_embed_pending(await self.bot.whitelist.fetch(ctx.author.id))
         await ctx.send(embed=embed)
 
     @Cog.listener("on_message")
@@ -42,6 +58,7 @@ class CommandsCog(Cog):
             await message.add_reaction("❌")
 
     @Cog.listener("on_raw_reaction_add")
+    @metrics.timed("reaction_listener")
     async def _reaction_listener(self, event: RawReactionActionEvent) -> None:
         if event.channel_id != self.bot.config["pending_app"]:
             return
@@ -49,15 +66,16 @@ class CommandsCog(Cog):
         if event.member == self.bot.user:
             return
 
-        message = await self.bot.get_guild(event.guild_id).get_channel(event.channel_id).fetch_message(event.message_id)
-        if len(message.embeds) == 0:
+        pending_app = await self.get_pending_app(self.bot.channels.get("pending_app"), event.message_id)
+        if pending_app is None:
             return
 
-        embed = message.embeds[0]
+        message = pending_app[0]
+        username = pending_app[3]
         if event.emoji == x:
             # if it cannot remove the reaction, ignore it
             try:
-                await message.remove_reaction(x, event.member)
+                await message.remove_reaction(x, event.member)  # type:ignore
             except BaseException as e:
                 logger.error("something went wrong, skipping the reaction removal")
                 logger.error(e)
@@ -66,35 +84,8 @@ class CommandsCog(Cog):
             await cmd.delete(delay=60)
 
         elif event.emoji == white_check_mark:
-            embed_dict = {
-                "title": embed.title,
-                "url": embed.url,
-                "footer": embed.footer.text,
-                "thumbnail": embed.thumbnail.url,
-                "description": embed.description + f"\n\n__**Staff member**__: {safify(event.member.display_name)}",  # type:ignore
-                "author": {"name": embed.author.name, "icon_url": embed.author.icon_url},
-            }
-            embed = self.bot.make_application_embed_processed(embed_dict, rejected=False)
-
-            await self.bot.send_validated(embed)
-            user_id = int(self.get_id_from_embed_app(embed))
-            try:
-                await message.delete()
-            except BaseException as e:
-                logger.error(e)
-            await self.bot.send_whitelist_command(self.get_username_from_embed_app(embed))
-            self.bot.whitelist[user_id]["status"] = "approved"
-            self.bot.whitelist.save_file()
-
-            user = self.bot.get_user(user_id)
-            if user is not None:
-                channel = user.dm_channel
-                if channel is None:
-                    channel = await user.create_dm()
-                await channel.send(
-                    "Your application has been approved. You'll be whitelisted shortly. If you cannot join "
-                    "despite you received this message, contact a team member."
-                )
+            await self.approve_app(pending_app, event.member.display_name)  # type:ignore
+            await self.bot.send_whitelist_command(username)
         else:
             logger.warning(f"skipping event reaction, unrecognized emoji: {event.emoji.name}")
 
@@ -120,14 +111,13 @@ class CommandsCog(Cog):
 
         # edit the internal state of the user in the whitelist
         if converted_user_id in self.bot.whitelist:
-            self.bot.whitelist[converted_user_id]["status"] = "blocked"
-            self.bot.whitelist[converted_user_id]["blacklist_reason"] = reason_message
+            record = await self.bot.whitelist.fetch(converted_user_id)
+            self.bot.whitelist.transition(converted_user_id, Status.BLOCKED, record, blacklist_reason=reason_message)
         else:
-            self.bot.whitelist[converted_user_id] = {"status": "blocked", "blacklist_reason": reason_message}
-        self.bot.whitelist.save_file()
+            self.bot.whitelist[converted_user_id] = Application(Status.BLOCKED, blacklist_reason=reason_message, timestamps={"blocked": time.time()})
 
         # send ban confirmation
-        user = self.bot.get_user(converted_user_id)
+        user = await self.bot.get_or_fetch_user(converted_user_id)
         if user is not None:
             await ctx.send(f"user {user.display_name} has been blacklisted from the bot. Reason: {reason_message}")
             channel = user.dm_channel
@@ -139,27 +129,75 @@ class CommandsCog(Cog):
 
     @discord.ext.commands.command(name="app_reason")
     async def _app_rejection(self, ctx: Context, guild_id: str, channel_id: str, message_id: str, *reason) -> None:
-        guild = self.bot.get_guild(int(guild_id))
-        channel = guild.get_channel(int(channel_id))
-        message = await channel.fetch_message(int(message_id))
+        pending_app = await self.get_pending_app(self.bot.channels.get_by_id(int(channel_id)), int(message_id))
         reason_message: str = safify(" ".join(["".join(word) for word in reason]))
-        if len(message.embeds) < 0:
+        if pending_app is None:
             return
-        embed = message.embeds[0]
+        await self.reject_app(pending_app, ctx.message.author.display_name, reason_message)
+        await ctx.message.delete()
+
+    @metrics.timed("approve_app")
+    async def approve_app(self, pending_app: Tuple[Message | PartialMessage, Embed, int, str], staff_member: str) -> None:
+        """
+        Approve a pending application: post it in the validated channel, remove it from the pending channel and tell
+        the applicant. The whitelist command is left to the caller, so it can be batched.
+        :param pending_app: the application, as returned by get_pending_app
+        :param staff_member: the name of the staff member approving the application
+        :return: None
+        """
+        message, embed, user_id, _ = pending_app
+        bind(user_id=user_id, reviewer=staff_member)
+        embed_dict = {
+            "title": embed.title,
+            "url": embed.url,
+            "footer": embed.footer.text,
+            "thumbnail": embed.thumbnail.url,
+            "description": embed.description + f"\n\n__**Staff member**__: {safify(staff_member)}",  # type:ignore
+            "author": {"name": embed.author.name, "icon_url": embed.author.icon_url},
+        }
+        embed = self.bot.make_application_embed_processed(embed_dict, rejected=False)
+
+        await self.bot.send_validated(embed)
+        try:
+            await message.delete()
+        except BaseException as e:
+            logger.error(e)
+        self.bot.whitelist.transition(user_id, Status.APPROVED, reviewer=staff_member)
+
+        user = await self.bot.get_or_fetch_user(user_id)
+        if user is not None:
+            channel = user.dm_channel
+            if channel is None:
+                channel = await user.create_dm()
+            await channel.send(
+                "Your application has been approved. You'll be whitelisted shortly. If you cannot join "
+                "despite you received this message, contact a team member."
+            )
+
+    @metrics.timed("reject_app")
+    async def reject_app(self, pending_app: Tuple[Message | PartialMessage, Embed, int, str], staff_member: str, reason_message: str) -> None:
+        """
+        Reject a pending application: post it in the rejected channel, remove it from the pending channel and tell the
+        applicant why.
+        :param pending_app: the application, as returned by get_pending_app
+        :param staff_member: the name of the staff member rejecting the application
+        :param reason_message: the reason of the rejection, already safified
+        :return: None
+        """
+        message, embed, user_id, _ = pending_app
+        bind(user_id=user_id, reviewer=staff_member)
         embed_dict = {
             "title": embed.title,
             "url": embed.url,
             "footer": embed.footer.text,
             "thumbnail": embed.thumbnail.url,
-            "description": embed.description + f"\n\n__**Staff member**__: {safify(ctx.message.author.display_name)}\n__" f"**Reason**__: {reason_message}",
+            "description": embed.description + f"\n\n__**Staff member**__: {safify(staff_member)}\n__" f"**Reason**__: {reason_message}",  # type:ignore
             "author": {"name": embed.author.name, "icon_url": embed.author.icon_url},
         }
         embed = self.bot.make_application_embed_processed(embed_dict)
         await self.bot.send_rejected(embed)
-        user_id = int(self.get_id_from_embed_app(embed))
-        self.bot.whitelist[user_id]["status"] = "rejected"
-        self.bot.whitelist.save_file()
-        user = self.bot.get_user(user_id)
+        self.bot.whitelist.transition(user_id, Status.REJECTED, reviewer=staff_member)
+        user = await self.bot.get_or_fetch_user(user_id)
         if user is not None:
             channel = user.dm_channel
             if channel is None:
@@ -169,7 +207,222 @@ class CommandsCog(Cog):
                 f"free to make a new one with the corrected changes"
             )
         await message.delete()
-        await ctx.message.delete()
+
+    @discord.ext.commands.command(name="approve_many")
+    @discord.ext.commands.guild_only()
+    @discord.ext.commands.has_role(team_member_role_id)
+    async def _approve_many(self, ctx: Context, *selection: str) -> None:
+        """
+        command to approve several pending applications at once
+        :param ctx: context
+        :param selection: message ids of the applications, and/or filters: status=<status> since=<YYYY-MM-DD> until=<YYYY-MM-DD>
+        :return: None
+        """
+        await self.process_many(ctx, selection, reason_message=None)
+
+    @discord.ext.commands.command(name="reject_many")
+    @discord.ext.commands.guild_only()
+    @discord.ext.commands.has_role(team_member_role_id)
+    async def _reject_many(self, ctx: Context, reason: str, *selection: str) -> None:
+        """
+        command to reject several pending applications at once
+        :param ctx: context
+        :param reason: the reason of the rejection, between quotes if it has several words
+        :param selection: message ids of the applications, and/or filters: status=<status> since=<YYYY-MM-DD> until=<YYYY-MM-DD>
+        :return: None
+        """
+        await self.process_many(ctx, selection, reason_message=safify(reason))
+
+    async def select_pending_messages(self, selection: Tuple[str, ...]) -> Tuple[List[int], int | None]:
+        """
+        Turn the selection of a bulk command into the ids of the pending messages.
+        :param selection: message ids, and/or filters: status=<status> since=<YYYY-MM-DD> until=<YYYY-MM-DD>
+        :return: the message ids, in order, and the number of records matching the filters, None without filters
+        :raise ValueError: if the selection is malformed
+        """
+        message_ids: List[int] = []
+        filters: Dict[str, Any] = dict()
+        for token in selection:
+            if "=" not in token:
+                message_ids.append(int(token))
+                continue
+
+            key, value = token.split("=", 1)
+            if key == "status":
+                filters["status"] = value
+            elif key in ("since", "until"):
+                filters[key] = datetime.datetime.strptime(value, "%Y-%m-%d").replace(tzinfo=datetime.timezone.utc).timestamp()
+            else:
+                raise ValueError(f"unknown filter {key}")
+
+        matched = None
+        if len(filters) > 0:
+            filters.setdefault("status", "pending")
+            records = await self.bot.whitelist.find(**filters)
+            matched = len(records)
+            message_ids.extend(record.pending_message_id for _, record in records if record.pending_message_id is not None)
+
+        # keep the first occurrence of each message
+        return list(dict.fromkeys(message_ids)), matched
+
+    async def process_many(self, ctx: Context, selection: Tuple[str, ...], reason_message: Optional[str]) -> None:
+        """
+        Approve or reject a batch of pending applications with a bounded concurrency. The store is written once at the
+        end, the whitelist commands are sent as a single batch, and the progress is edited in a single message.
+        :param ctx: context
+        :param selection: message ids, and/or filters: status=<status> since=<YYYY-MM-DD> until=<YYYY-MM-DD>
+        :param reason_message: the reason of the rejection, or None to approve the applications
+        :return: None
+        """
+        try:
+            message_ids, matched = await self.select_pending_messages(selection)
+        except ValueError as e:
+            await ctx.send(f"invalid selection: {e}. Use message ids and/or `status=<status>`, `since=<YYYY-MM-DD>`, `until=<YYYY-MM-DD>`.")
+            return
+
+        action = "approving" if reason_message is None else "rejecting"
+        if len(message_ids) == 0:
+            await ctx.send("no application matches the selection.")
+            return
+        if matched is not None:
+            await ctx.send(f"{matched} applications match the filters.")
+
+        channel: TextChannel = self.bot.channels.get("pending_app")
+        staff_member: str = ctx.author.display_name
+        semaphore = asyncio.Semaphore(self.bot.config["bulk_concurrency"])
+        progress = await ctx.send(f"{action} {len(message_ids)} applications: 0/{len(message_ids)}")
+        usernames: List[str] = []
+        failures: List[int] = []
+        done = 0
+        last_edit = time.monotonic()
+
+        async def process(message_id: int) -> None:
+            nonlocal done, last_edit
+            async with semaphore:
+                try:
+                    pending_app = await self.get_pending_app(channel, message_id)
+                    if pending_app is None:
+                        failures.append(message_id)
+                    elif reason_message is None:
+                        await self.approve_app(pending_app, staff_member)
+                        usernames.append(pending_app[3])
+                    else:
+                        await self.reject_app(pending_app, staff_member, reason_message)
+                except Exception as e:
+                    # e.g. a message that isn't an application, or an application already processed
+                    logger.error(f"bulk {action}: failed on message {message_id}: {e!r}")
+                    failures.append(message_id)
+
+                done += 1
+                # editing the progress message is rate limited too
+                if time.monotonic() - last_edit > 2:
+                    last_edit = time.monotonic()
+                    await progress.edit(content=f"{action} {len(message_ids)} applications: {done}/{len(message_ids)}")
+
+        # every application is done before the batch is written, even if the progress message can't be edited
+        with self.bot.whitelist.batch():
+            await asyncio.gather(*[process(message_id) for message_id in message_ids], return_exceptions=True)
+
+        if len(usernames) > 0:
+            await self.bot.send_whitelist_commands(usernames)
+
+        report = f"{action} {len(message_ids)} applications: done, {len(message_ids) - len(failures)} processed."
+        if len(failures) > 0:
+            report += f" Failed: {', '.join(str(message_id) for message_id in failures)}"
+        await progress.edit(content=report)
+
+    @metrics.timed("get_pending_app")
+    async def get_pending_app(self, channel: TextChannel, message_id: int) -> Optional[Tuple[Message | PartialMessage, Embed, int, str]]:
+        """
+        Get the application posted in a message of the pending channel. The message is only fetched and parsed if it
+        isn't in the pending index.
+        :param channel: the pending channel
+        :param message_id: the id of the message
+        :return: the message, the pending embed, the discord id and the minecraft name of the application, or None if the
+        message isn't an application
+        """
+        user_id = self.bot.whitelist.get_pending_message(message_id)
+        if user_id is not None:
+            record = self.bot.whitelist[user_id]
+            return channel.get_partial_message(message_id), self.bot.make_application_embed_pending(record), int(user_id), record.name
+
+        message = await channel.fetch_message(message_id)
+        if len(message.embeds) == 0:
+            return None
+        embed = message.embeds[0]
+        return message, embed, int(self.get_id_from_embed_app(embed)), self.get_username_from_embed_app(embed)
+
+    async def reconcile_pending_channel(self) -> None:
+        """
+        Rebuild the pending index from the history of the pending channel after a restart, and repair the orphans:
+        the pending applications without an embed are posted again, and the embeds missing their reactions get them
+        back. The embeds of applications that aren't pending anymore are only reported.
+        :return: None
+        """
+        start = time.perf_counter()
+        channel: TextChannel = self.bot.channels.get("pending_app")
+        semaphore = asyncio.Semaphore(self.bot.config["reconcile_concurrency"])
+        repairs: List[Awaitable[None]] = []
+        seen: Set[str] = set()
+        orphan_embeds = 0
+        scanned = 0
+        # the applications submitted or posted while the history is scanned already have their embed
+        posted_before = {
+            user_id: record.pending_message_id
+            for user_id, record in self.bot.whitelist.whitelist.items()
+            if record.status == Status.PENDING and record.submitted_at is not None
+        }
+
+        async def bounded(repair: Awaitable[None]) -> None:
+            async with semaphore:
+                try:
+                    await repair
+                except discord.HTTPException as e:
+                    logger.error(f"pending channel reconciliation: {e}")
+
+        # the history is fetched by pages of 100 messages
+        async for message in channel.history(limit=None):
+            if message.author != self.bot.user or len(message.embeds) == 0:
+                continue
+            scanned += 1
+
+            user_id = self.bot.whitelist.get_pending_message(message.id)
+            if user_id is None:
+                try:
+                    user_id = self.get_id_from_embed_app(message.embeds[0])
+                except IndexError:
+                    continue
+
+            if self.bot.whitelist.status(user_id) != Status.PENDING or user_id in seen:
+                orphan_embeds += 1
+                logger.warning(f"pending channel reconciliation: message {message.id} is not a pending application of {user_id}")
+                continue
+
+            seen.add(user_id)
+            if self.bot.whitelist[user_id].pending_message_id != message.id:
+                self.bot.whitelist.update(user_id, pending_message_id=message.id)
+
+            reacted = {str(reaction.emoji) for reaction in message.reactions if reaction.me}
+            for emoji in ("✅", "❌"):
+                if emoji not in reacted:
+                    repairs.append(bounded(message.add_reaction(emoji)))
+
+        # the applications still in an interview haven't been submitted yet, and the ones submitted or posted again
+        # during the scan aren't orphans
+        missing_embeds = [
+            (user_id, record)
+            for user_id, record in self.bot.whitelist.whitelist.items()
+            if user_id in posted_before and record.status == Status.PENDING and record.pending_message_id == posted_before[user_id] and user_id not in seen
+        ]
+        for user_id, record in missing_embeds:
+            logger.warning(f"pending channel reconciliation: posting again the application of {user_id}")
+            repairs.append(bounded(self.bot.send_pending(self.bot.make_application_embed_pending(record), int(user_id))))
+
+        await asyncio.gather(*repairs)
+        logger.info(
+            f"pending channel reconciliation done in {time.perf_counter() - start:.2f}s: {scanned} embeds scanned, {len(seen)} pending applications "
+            f"indexed, {len(missing_embeds)} posted again, {orphan_embeds} orphan embeds, {len(repairs) - len(missing_embeds)} reactions added"
+        )
 
     def get_id_from_embed_app(self, embed: Embed) -> str:
         pattern = re.compile("__\*\*Discord id\*\*__: ([0-9]+)")
@@ -181,22 +434,130 @@ class CommandsCog(Cog):
 
     @discord.ext.commands.command(name="reload_whitelist")
     async def _reload_whitelist(self, ctx: Context) -> None:
-        self.bot.whitelist.load_file()
-        await ctx.send("data successfully reloaded.")
+        changed = await self.bot.whitelist.reload()
+        await ctx.send(f"data successfully reloaded, {changed} records changed.")
+
+    @discord.ext.commands.command(name="reload_questions")
+    @discord.ext.commands.has_role(team_member_role_id)
+    async def _reload_questions(self, ctx: Context) -> None:
+        """
+        command to reload the questions of the interview from the questions file. The interviews already running keep
+        the questions they started with.
+        :param ctx: context
+        :return: None
+        """
+        try:
+            questions = await asyncio.get_running_loop().run_in_executor(None, load_questions, self.bot.questions_path)
+        except (OSError, ValueError) as e:
+            await ctx.send(f"failed to reload the questions, keeping the current ones: {e}")
+            return
+
+        self.bot.questions = questions
+        logger.info(f"reloaded {len(questions)} questions")
+        await ctx.send(f"{len(questions)} questions loaded: {', '.join(question.name for question in questions)}.")
+
+    @discord.ext.commands.command(name="find_app")
+    @discord.ext.commands.has_role(team_member_role_id)
+    async def _find_app(self, ctx: Context, name_or_uuid: str) -> None:
+        """
+        command to look for the applications made with a minecraft name or uuid
+        :param ctx: context
+        :param name_or_uuid: the minecraft name or uuid
+        :return: None
+        """
+        uuid = name_or_uuid.replace("-", "").lower()
+        if uuid_pattern.match(uuid):
+            results = await self.bot.whitelist.find(uuid=uuid)
+        else:
+            results = await self.bot.whitelist.find(name=name_or_uuid)
+
+        if len(results) == 0:
+            await ctx.send(f"no application found for {safify(name_or_uuid)}.")
+            return
+
+        lines = [f"<@{user_id}> ({user_id}): {safify(record.name or '?')} - {record.status.value}" for user_id, record in results[:20]]
+        await ctx.send("\n".join(lines), allowed_mentions=discord.AllowedMentions.none())
+
+    @discord.ext.commands.command(name="sessions")
+    @discord.ext.commands.has_role(team_member_role_id)
+    async def _sessions(self, ctx: Context) -> None:
+        sessions = self.bot.live_sessions
+        outbox = self.bot.outbox_stats
+        evicted = sessions.evict_idle()
+        counts = ", ".join(f"{name}: {count}" for name, count in sessions.counts().items())
+        lifecycle = ", ".join(f"{name}: {count}" for name, count in sorted(sessions.lifecycle.items())) or "none"
+        await ctx.send(
+            f"live sessions: {counts}\n"
+            f"approximate memory footprint: {sessions.memory_footprint() / 1024:.1f} KiB\n"
+            f"since startup: {lifecycle} ({evicted} idle sessions evicted just now)\n"
+            f"interview messages: {outbox.messages} sent in {outbox.api_calls} API calls ({outbox.calls_saved} saved)"
+        )
+
+    @discord.ext.commands.command(name="queue_stats")
+    @discord.ext.commands.has_role(team_member_role_id)
+    async def _queue_stats(self, ctx: Context) -> None:
+        # the columns are analyzed on a worker thread, from a copy since the records keep changing
+        columns = await self.bot.whitelist.analytics_columns()
+        stats = await asyncio.get_running_loop().run_in_executor(None, queue_stats, columns.copy())
+        await ctx.send(format_queue_stats(stats))
+
+    @discord.ext.commands.command(name="perf")
+    @discord.ext.commands.has_role(team_member_role_id)
+    async def _perf(self, ctx: Context) -> None:
+        if not metrics.enabled:
+            await ctx.send("the metrics are disabled, set perf_enabled in the config to enable them.")
+            return
+        for chunk in split_message(metrics.summary().split("\n")):
+            await ctx.send(f"```\n{chunk[:1990]}\n```")
+
+    @discord.ext.commands.command(name="console_queue")
+    @discord.ext.commands.has_role(team_member_role_id)
+    async def _console_queue(self, ctx: Context) -> None:
+        console = self.bot.console
+        await ctx.send(f"whitelist commands queued: {console.depth} ({console.in_flight} being sent). Messages sent: {console.sent}, failed: {console.failed}")
+
+    @discord.ext.commands.command(name="mojang_stats")
+    @discord.ext.commands.has_role(team_member_role_id)
+    async def _mojang_stats(self, ctx: Context) -> None:
+        await ctx.send(f"```\n{self.bot.mojang.metrics.summary()}\n```")
 
     @discord.ext.commands.command(name="stats_users")
     @discord.ext.commands.guild_only()
     @discord.ext.commands.has_role(team_member_role_id)
     async def _member_rank(self, ctx: Context) -> None:
+        if self.stats_export is not None and not self.stats_export.done():
+            await ctx.send("statistics are already being generated.")
+            return
         await ctx.send("generating statistics...")
-        raw_member_list: List[Member] = [m for m in ctx.guild.members if m.joined_at is not None]  # type:ignore
-        raw_member_list.sort(key=lambda x: x.joined_at)  # type:ignore
-        member_list = [
-            (raw_member_list[i].joined_at.isoformat(), i + 1, raw_member_list[i].name, raw_member_list[i].id) for i in range(len(raw_member_list))
-        ]  # type:ignore
-        with open(stats_path, "w") as file:
-            json.dump(member_list, file)
-        await ctx.send("statistics generated.")
+        self.stats_export = asyncio.ensure_future(self.export_member_stats(ctx))
+
+    async def export_member_stats(self, ctx: Context) -> None:
+        """
+        Stream the members of the guild to a MemberStatsExport, then post the statistics it computed.
+        :param ctx: context of the command
+        :return: None
+        """
+        guild: discord.Guild = ctx.guild  # type:ignore
+        export = MemberStatsExport(self.bot.data_dir / "info.ndjson")
+        try:
+            rows: List[MemberRow] = []
+            # in lean mode the members aren't cached, fetch them
+            members = iter_cached_members(guild) if guild.chunked else guild.fetch_members(limit=None)
+            async for member in members:
+                if member.joined_at is not None:
+                    rows.append((member.id, member.name, member.joined_at.timestamp()))
+                if len(rows) >= export.chunk_size:
+                    export.feed(rows)
+                    rows = []
+            export.feed(rows)
+        except BaseException as e:
+            export.abort()
+            logger.error(f"failed to export the member statistics: {e!r}")
+            await ctx.send("failed to generate the statistics.")
+            raise
+
+        summary = await export.finish()
+        await ctx.send(f"statistics generated in {summary['duration']:.1f}s.\n{format_summary(summary)}")
 
 
 def setup(bot: BotBase) -> None:
@@ -0,0 +1,137 @@
+import asyncio
+import logging
+from typing import Callable, Dict, List, Optional
+
+import discord
+
+from src.outbox import split_message
+from src.perf import metrics
+
+logger = logging.getLogger("bot - console")
+
+
+class ConsoleDispatcher:
+    """
+    Background queue posting the whitelist commands in the console channels.
+
+    The names are deduplicated while they wait, the commands gathered during batch_window are merged into multi-line
+    messages, every console channel is sent to concurrently, and a failed send is retried with an exponential backoff.
+    """
+
+    def __init__(self, get_channels: Callable[[], List[discord.abc.Messageable]], batch_window: float, max_retries: int) -> None:
+        self.get_channels: Callable[[], List[discord.abc.Messageable]] = get_channels
+        self.batch_window: float = batch_window
+        self.max_retries: int = max_retries
+        # lowercased name -> name, in arrival order
+        self.pending: Dict[str, str] = dict()
+        self.in_flight: int = 0
+        self.sent: int = 0
+        self.failed: int = 0
+        self.wakeup = asyncio.Event()
+        self.task: Optional[asyncio.Task[None]] = None
+        # the dispatch started by the worker, awaited rather than cancelled when stopping
+        self.dispatching: Optional[asyncio.Future[None]] = None
+
+    @property
+    def depth(self) -> int:
+        return len(self.pending) + self.in_flight
+
+    def enqueue(self, usernames: List[str]) -> None:
+        """
+        Queue the whitelisting of some minecraft names. Returns right away.
+        :param usernames: the minecraft names
+        :return: None
+        """
+        for username in usernames:
+            username = username.replace("\\_", "_")
+            self.pending.setdefault(username.lower(), username)
+        self.wakeup.set()
+
+    def start(self) -> None:
+        """
+        Start the background worker. Must be called from within the event loop.
+        :return: None
+        """
+        if self.task is None or self.task.done():
+            self.task = asyncio.ensure_future(self.run())
+
+    async def stop(self) -> None:
+        """
+        Stop the background worker, let the dispatch in progress finish, then send what is still queued.
+        :return: None
+        """
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+        if self.dispatching is not None and not self.dispatching.done():
+            try:
+                await self.dispatching
+            except Exception as e:
+                logger.error(f"console dispatch failed: {e!r}")
+        if len(self.pending) > 0:
+            await self.dispatch()
+
+    async def run(self) -> None:
+        """
+        Background worker: wait for names, let a batch build up, then send it. After a failed dispatch, the names still
+        queued are dispatched again with an exponential backoff.
+        :return: None
+        """
+        failures = 0
+        while True:
+            await self.wakeup.wait()
+            await asyncio.sleep(self.batch_window)
+            self.wakeup.clear()
+            self.dispatching = asyncio.ensure_future(self.dispatch())
+            try:
+                # stopping the worker doesn't cancel the dispatch, whose names are already out of the queue
+                await asyncio.shield(self.dispatching)
+                failures = 0
+            except Exception as e:
+                failures += 1
+                delay = min(2**failures, 60)
+                logger.error(f"console dispatch failed: {e!r}, retrying in {delay}s")
+                await asyncio.sleep(delay)
+                if len(self.pending) > 0:
+                    self.wakeup.set()
+
+    @metrics.timed("console_dispatch")
+    async def dispatch(self) -> None:
+        """
+        Send the queued names to every console channel.
+        :return: None
+        """
+        if len(self.pending) == 0:
+            return
+        # a missing channel raises before the names are taken, so they stay queued
+        channels = self.get_channels()
+        names, self.pending = list(self.pending.values()), dict()
+
+        self.in_flight += len(names)
+        messages = split_message([f"whitelist add {name}" for name in names])
+        try:
+            await asyncio.gather(*[self.send_to_channel(channel, messages) for channel in channels])
+        finally:
+            self.in_flight -= len(names)
+
+    async def send_to_channel(self, channel: discord.abc.Messageable, messages: List[str]) -> None:
+        """
+        Send some messages in order to a console channel, retrying each one with an exponential backoff.
+        :param channel: the console channel
+        :param messages: the messages
+        :return: None
+        """
+        for content in messages:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    await channel.send(content)
+                    self.sent += 1
+                    break
+                except discord.HTTPException as e:
+                    if attempt == self.max_retries:
+                        self.failed += 1
+                        logger.error(f"giving up sending whitelist commands after {attempt + 1} attempts: {e}\n{content}")
+                        break
+                    delay = min(2**attempt, 60)
+                    logger.warning(f"failed to send whitelist commands ({e}), retrying in {delay}s")
+                    await asyncio.sleep(delay)
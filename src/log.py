@@ -0,0 +1,145 @@
+import atexit
+import contextvars
+import datetime
+import json
+import logging
+import logging.handlers
+import queue
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+# fields attached to the logs of the current task, e.g. the id of the user being interviewed
+log_context: contextvars.ContextVar[Dict[str, Any]] = contextvars.ContextVar("log_context", default={})
+
+text_format = "%(asctime)s - %(levelname)s - %(name)s - %(message)s"
+
+listener: Optional[logging.handlers.QueueListener] = None
+# the records logged before setup_logging, written to the log file once it's set up
+early_records: Optional["EarlyRecords"] = None
+
+
+def bind(**fields: Any) -> None:
+    """
+    Attach some fields to the logs of the current task, and of the tasks it starts.
+    :param fields: the fields, e.g. user_id
+    :return: None
+    """
+    log_context.set({**log_context.get(), **fields})
+
+
+class ContextFilter(logging.Filter):
+    """
+    Copies the fields of the log context onto the records. It runs on the thread that logs, before the record is
+    handed to the listener thread, which doesn't see the context.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.context = log_context.get()
+        return True
+
+
+class JSONFormatter(logging.Formatter):
+    """
+    Formats the records as json lines, with the fields of the log context.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            **getattr(record, "context", {}),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class EarlyRecords(logging.handlers.BufferingHandler):
+    """
+    Keeps all the records logged before the log file is known.
+    """
+
+    def shouldFlush(self, record: logging.LogRecord) -> bool:
+        return False
+
+
+def setup_early_logging() -> None:
+    """
+    Log to stderr until the config is loaded and setup_logging is called, e.g. the problems found in the config. The
+    records are kept, and setup_logging writes them to the log file.
+    :return: None
+    """
+    global early_records
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter(text_format))
+    early_records = EarlyRecords(capacity=0)
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(stream_handler)
+    root.addHandler(early_records)
+    root.setLevel(logging.INFO)
+
+
+def setup_logging(config: Any, log_path: Path) -> None:
+    """
+    Route all the logs through a queue to a background thread, which does the formatting and the disk writes.
+    Calling it again replaces the previous setup.
+    :param config: the config of the bot
+    :param log_path: the path of the log file
+    :return: None
+    """
+    global listener, early_records
+    stop_logging()
+
+    if config["log_rotate_when"]:
+        file_handler: logging.Handler = logging.handlers.TimedRotatingFileHandler(
+            log_path, when=config["log_rotate_when"], backupCount=config["log_backup_count"]
+        )
+    else:
+        file_handler = logging.handlers.RotatingFileHandler(log_path, maxBytes=config["log_max_bytes"], backupCount=config["log_backup_count"])
+    file_handler.setFormatter(JSONFormatter() if config["log_format"] == "json" else logging.Formatter(text_format))
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter(text_format))
+
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(ContextFilter())
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(config["log_level"])
+    for name, level in config["log_levels"].items():
+        logging.getLogger(name).setLevel(level)
+
+    # they were already shown on stderr
+    if early_records is not None:
+        for record in early_records.buffer:
+            if record.levelno >= root.level:
+                file_handler.handle(record)
+        early_records.close()
+        early_records = None
+
+    listener = logging.handlers.QueueListener(log_queue, file_handler, stream_handler, respect_handler_level=True)
+    listener.start()
+
+
+def stop_logging() -> None:
+    """
+    Write the logs still queued, and stop the background thread.
+    :return: None
+    """
+    global listener
+    if listener is not None:
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
+        listener = None
+
+
+atexit.register(stop_logging)
@@ -1,43 +1,41 @@
 import asyncio
+import contextlib
+import contextvars
 import datetime
 import json
 import logging
-import re
 import sys
+import time
 from pathlib import Path
-from typing import Any, Dict, List, Tuple
+from typing import Any, Dict, Iterator, List, Set, Tuple
 
 import discord
-import requests
-from discord import Member, TextChannel, User, DiscordServerError
+from discord import Member, User, DiscordServerError
 from discord.ext.commands import Bot
 
+from src.admission import AdmissionController
+from src.analytics import ApplicationColumns
+from src.application import Application, Status
+from src.archive import Archive, partition_of
+from src.channels import ChannelResolver
 from src.command_cog import CommandsCog
-from src.question import Question, QuestionType
+from src.console import ConsoleDispatcher
+from src.log import bind, setup_early_logging, setup_logging
+from src.mojang import MojangAPIError, MojangProfile, MojangResolver
+from src.outbox import DMWriter, OutboxStats, safify
+from src.perf import metrics, start_monitoring
+from src.question import Question, handlers, load_questions
+from src.router import MessageRouter
+from src.session import InterviewSession, SessionRegistry, SessionStore
+from src.storage import JournalStore, SQLiteStore, application_time, atomic_write_json
+from src.whitelist_sync import WhitelistSync
 
-logging.basicConfig(filename=Path(__file__).parent.parent / "bot.log", filemode="a", format="%(asctime)s - %(levelname)s - %(name)s - %(message)s", level=logging.INFO)
-
-logging.getLogger().addHandler(logging.StreamHandler())
 logger = logging.getLogger("bot - main")
 
 
-def safify(msg: str) -> str:
-    return msg.replace("~", "\\~").replace("|", "\\|").replace("*", "\\*").replace("_", "\\_")
-
-
-def check_3_sentences(msg: str) -> bool:
-    """
-    Checks if the message has at least 3 sentence.
-
-    :param msg: the message
-    :return: yes if there is 3 sentences.
-    """
-    return msg.count(".") >= 3
-
-
 class Config:
-    def __init__(self) -> None:
-        self.conf_path: Path = Path(__file__).parent.parent / "bot.conf"
+    def __init__(self, conf_path: Path | None = None) -> None:
+        self.conf_path: Path = conf_path or Path(__file__).parent.parent / "bot.conf"
         self.base_config = {
             "token": None,
             "guild_id": None,
@@ -47,6 +45,42 @@ class Config:
             "pending_app": 905623774618071110,
             "console channels": [905644966901076051],
             "whitelists_closed": False,
+            "mojang_api_url": "https://api.mojang.com",
+            "mojang_timeout": 5,
+            "mojang_cache_size": 4096,
+            "mojang_cache_ttl": 3600,
+            "mojang_negative_cache_ttl": 60,
+            "mojang_batch_window": 0.25,
+            "journal_compact_every": 1000,
+            "storage_backend": "journal",
+            "session_resume_window": 3600,
+            "max_active_interviews": 50,
+            "queue_update_interval": 60,
+            "max_live_sessions": 5000,
+            "session_idle_timeout": 900,
+            "dm_flush_window": 0.5,
+            "reconcile_concurrency": 4,
+            "bulk_concurrency": 4,
+            "console_batch_window": 1,
+            "console_max_retries": 5,
+            "whitelist_sync_mode": "console",
+            "whitelist_files": [],
+            "lean_mode": False,
+            "log_level": "INFO",
+            "log_levels": {"discord": "INFO"},
+            "log_format": "text",
+            "log_max_bytes": 10 * 1024 * 1024,
+            "log_backup_count": 5,
+            "log_rotate_when": "",
+            "perf_enabled": False,
+            "perf_loop_lag_interval": 0.5,
+            "perf_prometheus_file": "",
+            "perf_dump_interval": 15,
+            "data_dir": "",
+            "questions_file": "",
+            "lazy_terminal_records": False,
+            "archive_after_days": 180,
+            "archive_interval": 86400,
         }
 
         self.config: Dict[str, Any] = {}
@@ -112,31 +146,131 @@ class Config:
         json.dump(config, open(self.conf_path, "w"))
 
 
+def get_data_dir(config: Config) -> Path:
+    """
+    Get the directory of the data files of the bot (records, sessions, logs...).
+    :param config: the config
+    :return: data_dir if it is set in the config, the root of the repository otherwise
+    """
+    return Path(config["data_dir"]) if config["data_dir"] else Path(__file__).parent.parent
+
+
 class WhitelistedPlayers:
-    def __init__(self) -> None:
-        self.file_path = Path(__file__).parent.parent / "whitelisted_players.json"
-        self.whitelist: Dict[Any, Any] = dict()
+    def __init__(self, config: Config) -> None:
+        data_dir = get_data_dir(config)
+        self.file_path = data_dir / "whitelisted_players.json"
+        self.journal_path = data_dir / "whitelisted_players.journal"
+        self.db_path = data_dir / "whitelisted_players.db"
+        self.store: JournalStore | SQLiteStore
+        if config["storage_backend"] == "sqlite":
+            self.store = SQLiteStore(self.db_path)
+            self.store.migrate_from_json(self.file_path, self.journal_path)
+        else:
+            self.store = JournalStore(self.file_path, self.journal_path, compact_every=config["journal_compact_every"])
+        self.whitelist: Dict[str, Application] = dict()
+        # the approved, rejected and blocked records can be left on the disk and read when needed, which needs the
+        # point queries of the sqlite store
+        self.lazy: bool = config["lazy_terminal_records"] and isinstance(self.store, SQLiteStore)
+        if config["lazy_terminal_records"] and not self.lazy:
+            logger.warning("lazy_terminal_records needs the sqlite storage backend, all the records are kept in memory.")
+        # discord id -> status of the records left on the disk
+        self.on_disk: Dict[str, Status] = dict()
+        # the approved and rejected records processed long ago are moved out of the store, into the archive
+        self.archive = Archive(data_dir / "archive")
+        # discord id -> (status, partition) of the archived records
+        self.archived: Dict[str, Tuple[Status, str]] = dict()
+        # discord ids changed while a reload reads the disk, the reload leaves them alone
+        self.reloading: Set[str] | None = None
+        # a reload and an archiving both read the whole store, they run one at a time
+        self.disk_lock = asyncio.Lock()
+        # pending message id -> discord id, for the applications waiting for a review
+        self.pending_messages: Dict[int, str] = dict()
+        # records changed by the tasks of a batch, written to the store when it ends. Each batch has its own buffer,
+        # seen by the tasks it starts only: the other writes made meanwhile go to the store right away
+        self.deferred: contextvars.ContextVar[Dict[str, Application] | None] = contextvars.ContextVar("deferred", default=None)
+        # the buffers of the batches in progress
+        self.open_batches: List[Dict[str, Application]] = []
+        # the applications as columns for the statistics, built at their first use then kept up to date
+        self.columns: ApplicationColumns | None = None
+        # discord id -> record, None if deleted, of the records changed while the columns are built
+        self.columns_changes: Dict[str, Application | None] | None = None
+        # "console" posts the whitelist commands in the console channels, "file" writes the whitelist.json of the
+        # servers directly, "both" does both
+        self.sync: WhitelistSync | None = None
+        if config["whitelist_sync_mode"] in ("file", "both"):
+            self.sync = WhitelistSync([Path(path) for path in config["whitelist_files"]], data_dir / "whitelist_sync.json")
         self.load_file()
 
-    def __getitem__(self, item: Any) -> Any:
+    def __getitem__(self, item: Any) -> Application:
         if item is not str:
             item = str(item)
-        return self.whitelist[item]
-
-    def __setitem__(self, key: Any, value: Any) -> None:
+        record = self.whitelist.get(item)
+        if record is not None:
+            return record
+        if item in self.on_disk:
+            deferred = self.deferred.get()
+            if deferred is not None and item in deferred:
+                return deferred[item]
+            assert isinstance(self.store, SQLiteStore)
+            # a lookup on the primary key, queued after the pending writes of the record
+            data = self.store.get(item)
+            if data is not None:
+                return Application.from_dict(data)
+        if item in self.archived:
+            # reads a whole partition, the coroutines use fetch() instead
+            data = self.archive.get(item, self.archived[item][1])
+            if data is not None:
+                return Application.from_dict(data)
+        raise KeyError(item)
+
+    def __setitem__(self, key: Any, value: Application) -> None:
         if key is not str:
             key = str(key)
-        self.whitelist[key] = value
+        if self.reloading is not None:
+            self.reloading.add(key)
+        self.unindex(key)
+        if self.lazy and value.status.terminal:
+            self.whitelist.pop(key, None)
+            self.on_disk[key] = value.status
+        else:
+            self.on_disk.pop(key, None)
+            self.whitelist[key] = value
+            self.index(key)
+        if self.sync is not None:
+            self.sync.track(key, value)
+        self.track_columns(key, value)
+        deferred = self.deferred.get()
+        if deferred is not None:
+            deferred[key] = value
+        else:
+            self.store.put(key, value.to_dict())
+            metrics.inc("store_writes")
+            if self.sync is not None:
+                self.sync.flush()
 
     def __delitem__(self, key: Any) -> None:
         if key is not str:
             key = str(key)
-        del self.whitelist[key]
+        if self.reloading is not None:
+            self.reloading.add(key)
+        self.unindex(key)
+        if self.whitelist.pop(key, None) is None and self.on_disk.pop(key, None) is None:
+            raise KeyError(key)
+        # a batch must not write the record back when it ends
+        for deferred in self.open_batches:
+            deferred.pop(key, None)
+        self.track_columns(key, None)
+        self.store.delete(key)
+        metrics.inc("store_writes")
+        if self.sync is not None:
+            self.sync.track(key, None)
+            if self.deferred.get() is None:
+                self.sync.flush()
 
     def __contains__(self, key: Any) -> bool:
         if key is not str:
             key = str(key)
-        return key in self.whitelist
+        return key in self.whitelist or key in self.on_disk or key in self.archived
 
     def __repr__(self) -> str:
         return self.__str__()
@@ -144,33 +278,410 @@ class WhitelistedPlayers:
     def __str__(self) -> str:
         return str(self.whitelist)
 
+    def status(self, key: Any) -> Status | None:
+        """
+        Get the status of a record, without reading it from the disk.
+        :param key: the discord id of the record
+        :return: the status, or None if there is no record
+        """
+        key = str(key)
+        record = self.whitelist.get(key)
+        if record is not None:
+            return record.status
+        if key in self.on_disk:
+            return self.on_disk[key]
+        archived = self.archived.get(key)
+        return archived[0] if archived is not None else None
+
+    def track_columns(self, key: str, record: Application | None) -> None:
+        """
+        Update the row of a record in the columns of the statistics.
+        :param key: the discord id of the record
+        :param record: the record, None if it was deleted
+        :return: None
+        """
+        if self.columns_changes is not None:
+            self.columns_changes[key] = record
+        if self.columns is not None:
+            if record is None:
+                self.columns.remove(key)
+            else:
+                self.columns.set(key, record)
+
+    def index(self, key: str) -> None:
+        """
+        Add a record to the pending index if it's waiting for a review.
+        :param key: the discord id of the record
+        :return: None
+        """
+        record = self.whitelist[key]
+        if record.status == Status.PENDING and record.pending_message_id is not None:
+            self.pending_messages[record.pending_message_id] = key
+
+    def unindex(self, key: str) -> None:
+        """
+        Remove a record from the pending index.
+        :param key: the discord id of the record
+        :return: None
+        """
+        record = self.whitelist.get(key)
+        if record is not None and record.pending_message_id is not None:
+            self.pending_messages.pop(record.pending_message_id, None)
+
+    def get_pending_message(self, message_id: int) -> str | None:
+        """
+        Get the application posted in a message of the pending channel.
+        :param message_id: the id of the message
+        :return: the discord id of the application, or None if the message isn't indexed
+        """
+        return self.pending_messages.get(message_id)
+
+    @contextlib.contextmanager
+    def batch(self) -> Iterator[None]:
+        """
+        Context manager deferring the writes made inside it, and in the tasks started inside it, to a single write at
+        the end. Batches can overlap, each one writes the records it changed.
+        :return: None
+        """
+        deferred: Dict[str, Application] = dict()
+        token = self.deferred.set(deferred)
+        self.open_batches.append(deferred)
+        try:
+            yield
+        finally:
+            self.deferred.reset(token)
+            self.open_batches.remove(deferred)
+            if len(deferred) > 0:
+                self.store.put_many([(key, record.to_dict()) for key, record in deferred.items()])
+                metrics.inc("store_writes", len(deferred))
+            if self.sync is not None:
+                self.sync.flush()
+
+    async def fetch(self, key: Any) -> Application:
+        """
+        Get a record, reading it from the disk or the archive in the background if it isn't in memory. The coroutines
+        use it rather than whitelist[key], which blocks the loop on the disk.
+        :param key: the discord id of the record
+        :return: the record
+        :raise KeyError: if there is no record
+        """
+        key = str(key)
+        record = self.whitelist.get(key)
+        if record is not None:
+            return record
+        deferred = self.deferred.get()
+        if deferred is not None and key in deferred:
+            return deferred[key]
+        if key in self.on_disk:
+            assert isinstance(self.store, SQLiteStore)
+            data = await asyncio.wrap_future(self.store.lookup(key))
+            if data is not None:
+                return Application.from_dict(data)
+        if key in self.archived:
+            # decompresses a whole partition
+            data = await asyncio.get_running_loop().run_in_executor(None, self.archive.get, key, self.archived[key][1])
+            if data is not None:
+                return Application.from_dict(data)
+        raise KeyError(key)
+
+    def update(self, key: Any, record: Application | None = None, **fields: Any) -> None:
+        """
+        Change some fields of a record and save it.
+        :param key: the discord id of the record
+        :param record: the record, when it was already fetched
+        :param fields: the fields to change
+        :return: None
+        """
+        record = record or self[key]
+        self.unindex(str(key))
+        for field, value in fields.items():
+            setattr(record, field, value)
+        self[key] = record
+
+    def transition(self, key: Any, status: Status, record: Application | None = None, **fields: Any) -> None:
+        """
+        Change the status of a record, and record when it happened.
+        :param key: the discord id of the record
+        :param status: the new status
+        :param record: the record, when it was already fetched
+        :param fields: other fields to change
+        :return: None
+        """
+        record = record or self[key]
+        self.update(key, record, status=status, timestamps={**record.timestamps, status.value: time.time()}, **fields)
+
+    async def records(self) -> Dict[str, Application]:
+        """
+        Get all the records, including the ones left on the disk and the archived ones, which are read in the background.
+        :return: discord id -> record
+        """
+        records = dict(self.whitelist)
+        on_disk = set(self.on_disk)
+        hot = set(self.whitelist) | on_disk
+
+        def read() -> Dict[str, Application]:
+            loaded = {key: Application.from_dict(data) for key, data in self.store.read().result().items() if key in on_disk} if len(on_disk) > 0 else {}
+            loaded.update({key: Application.from_dict(data) for key, data in self.archive.scan(lambda _: True) if key not in hot})
+            return loaded
+
+        records.update(await asyncio.get_running_loop().run_in_executor(None, read))
+        return records
+
+    async def analytics_columns(self) -> ApplicationColumns:
+        """
+        Get the applications as columns for the statistics. They are built from all the records in the background the
+        first time, then kept up to date as the records change.
+        :return: the columns
+        """
+        async with self.disk_lock:
+            if self.columns is None:
+                self.columns_changes = dict()
+                try:
+                    records = await self.records()
+                    columns = await asyncio.get_running_loop().run_in_executor(None, ApplicationColumns.from_records, records)
+                finally:
+                    changes, self.columns_changes = self.columns_changes, None
+                for key, record in changes.items():
+                    if record is None:
+                        columns.remove(key)
+                    else:
+                        columns.set(key, record)
+                self.columns = columns
+            return self.columns
+
+    async def find(
+        self, status: str | None = None, uuid: str | None = None, name: str | None = None, since: float | None = None, until: float | None = None
+    ) -> List[Tuple[str, Application]]:
+        """
+        Search the records matching all the given criteria.
+        :param status: only the records with this status
+        :param uuid: only the records with this minecraft uuid
+        :param name: only the records with this minecraft name, case-insensitive
+        :param since: only the applications made after this timestamp
+        :param until: only the applications made before this timestamp
+        :return: a list of (discord id, record)
+        """
+        results = await self.find_hot(status, uuid, name, since, until)
+        if status == Status.PENDING or len(self.archived) == 0:
+            return results
+
+        def matches(data: Dict[str, Any]) -> bool:
+            if status is not None and data.get("status") != status:
+                return False
+            if uuid is not None and data.get("uuid") != uuid:
+                return False
+            if name is not None and (data.get("name") or "").lower() != name.lower():
+                return False
+            if since is not None or until is not None:
+                applied_at = application_time(data)
+                if applied_at is None or (since is not None and applied_at < since) or (until is not None and applied_at >= until):
+                    return False
+            return True
+
+        # the applications are processed after they are made, the partitions older than since can be skipped
+        rows = await asyncio.get_running_loop().run_in_executor(None, self.archive.scan, matches, since)
+        found = {key for key, _ in results}
+        results += [(key, Application.from_dict(data)) for key, data in rows if key not in found and key not in self.whitelist and key not in self.on_disk]
+        return results
+
+    async def find_hot(
+        self, status: str | None = None, uuid: str | None = None, name: str | None = None, since: float | None = None, until: float | None = None
+    ) -> List[Tuple[str, Application]]:
+        """
+        Search the records of the main store matching all the given criteria.
+        :param status: only the records with this status
+        :param uuid: only the records with this minecraft uuid
+        :param name: only the records with this minecraft name, case-insensitive
+        :param since: only the applications made after this timestamp
+        :param until: only the applications made before this timestamp
+        :return: a list of (discord id, record)
+        """
+        if isinstance(self.store, SQLiteStore):
+            rows = await self.store.query(status=status, uuid=uuid, name=name, since=since, until=until)
+            return [(key, Application.from_dict(data)) for key, data in rows]
+
+        # the json store has no index, scan the records
+        results = []
+        for key, record in self.whitelist.items():
+            if status is not None and record.status != status:
+                continue
+            if uuid is not None and record.uuid != uuid:
+                continue
+            if name is not None and (record.name or "").lower() != name.lower():
+                continue
+            if since is not None or until is not None:
+                applied_at = record.submitted_at
+                if applied_at is None or (since is not None and applied_at < since) or (until is not None and applied_at >= until):
+                    continue
+            results.append((key, record))
+        return results
+
+    def read_store(self, initial: bool = False) -> Tuple[Dict[str, Application], Dict[str, Status], Dict[str, Tuple[Status, str]], Dict[str, Application]]:
+        """
+        Read the records from the disk. Unless initial is set, it doesn't change the state, so it can run on a worker
+        thread.
+        :param initial: True for the first read, on the loop thread, which also lets the json store count the entries
+        of its journal
+        :return: the resident records, the status of the records left on the disk, the status and partition of the
+        archived records, and the records the whitelist sync is built from
+        """
+        if self.lazy:
+            assert isinstance(self.store, SQLiteStore)
+            # only the pending records are read, the whitelist sync only needs the indexed fields of the others
+            resident = {key: Application.from_dict(data) for key, data in self.store.load(status=Status.PENDING.value).items()}
+            index = {key: Application(Status(status or Status.PENDING.value), name=name, uuid=uuid) for key, status, uuid, name in self.store.load_index()}
+            on_disk = {key: record.status for key, record in index.items() if record.status.terminal}
+            synced = index
+        else:
+            # replay the journal on top of the last snapshot
+            records = self.store.load() if initial else self.store.read().result()
+            resident = {key: Application.from_dict(data) for key, data in records.items()}
+            on_disk = dict()
+            synced = dict(resident)
+
+        archived: Dict[str, Tuple[Status, str]] = dict()
+        partitions: Dict[str, str] = dict()
+        for key, (status, partition, uuid, name) in self.archive.read_index().items():
+            if key in synced:
+                continue
+            archived[key] = (Status(status), partitions.setdefault(partition, partition))  # type: ignore
+            synced[key] = Application(Status(status), name=name, uuid=uuid)
+        return resident, on_disk, archived, synced
+
     def load_file(self) -> None:
         """
         Load the file
         :return: None
         """
         # check if the config exists
-        if not self.file_path.exists():
+        if isinstance(self.store, JournalStore) and not self.file_path.exists():
             self.create_file()
             logger.info("file of already whitelisted players not found. Created the file.")
 
-        # load the config file
-        self.whitelist = json.load(open(self.file_path, "r"))
+        self.whitelist, self.on_disk, self.archived, synced = self.read_store(initial=True)
+        self.pending_messages = dict()
+        for key in self.whitelist:
+            self.index(key)
+        if self.sync is not None:
+            self.sync.rebuild(synced)
         logger.info("already whitelisted players file loaded successfully.")
 
+    async def reload(self) -> int:
+        """
+        Reload the records from the disk, e.g. after they were edited by hand. The disk is read on a worker thread, and
+        only the records that changed are applied. The records changed by the bot in the meantime are kept.
+        :return: the number of records changed
+        """
+        async with self.disk_lock:
+            self.reloading = set()
+            current = dict(self.whitelist)
+            try:
+                resident, on_disk, archived, synced = await asyncio.get_running_loop().run_in_executor(None, self.read_store)
+
+                def diff() -> Dict[str, Application | None]:
+                    changes: Dict[str, Application | None] = {key: None for key in current if key not in resident}
+                    for key, record in resident.items():
+                        old = current.get(key)
+                        if old is None or old.to_dict() != record.to_dict():
+                            changes[key] = record
+                    return changes
+
+                changes = await asyncio.get_running_loop().run_in_executor(None, diff)
+                changed = self.reloading
+            finally:
+                self.reloading = None
+
+            for key, new in changes.items():
+                if key in changed:
+                    continue
+                self.unindex(key)
+                if new is None:
+                    self.whitelist.pop(key, None)
+                else:
+                    self.whitelist[key] = new
+                    self.index(key)
+                if self.sync is not None:
+                    self.sync.track(key, new or synced.get(key))
+
+            previous_on_disk = self.on_disk
+            self.on_disk = {key: status for key, status in on_disk.items() if key not in changed}
+            self.on_disk.update({key: status for key, status in previous_on_disk.items() if key in changed})
+            self.archived = archived
+            if self.sync is not None:
+                for key, status in self.on_disk.items():
+                    if previous_on_disk.get(key) != status:
+                        self.sync.track(key, synced[key])
+                self.sync.flush()
+
+            # the records read again are analyzed from scratch at the next use
+            self.columns = None
+            updated = len([key for key in changes if key not in changed])
+            logger.info(f"reloaded the whitelisted players: {updated} records changed")
+            return updated
+
+    async def archive_old_records(self, max_age: float) -> int:
+        """
+        Move the approved and rejected records processed more than max_age ago from the main store to the archive. The
+        records are read and archived in the background, then removed from the store with a single write.
+        :param max_age: the age of the records to archive, in seconds
+        :return: the number of records archived
+        """
+        cutoff = time.time() - max_age
+
+        def collect() -> Dict[str, Tuple[str, Dict[str, Any]]]:
+            old = dict()
+            for key, data in self.store.read().result().items():
+                processed = Application.from_dict(data).processed_at
+                if processed is not None and processed < cutoff:
+                    old[key] = (partition_of(processed), data)
+            return old
+
+        loop = asyncio.get_running_loop()
+        async with self.disk_lock:
+            old = await loop.run_in_executor(None, collect)
+            if len(old) == 0:
+                return 0
+            await loop.run_in_executor(None, self.archive.add, old)
+
+            # the records changed since they were read stay in the store, their archived copy is shadowed by the store
+            archived = []
+            for key, (partition, data) in old.items():
+                status = self.status(key)
+                if status is None or status.value != data.get("status") or any(key in deferred for deferred in self.open_batches):
+                    continue
+                self.unindex(key)
+                self.whitelist.pop(key, None)
+                self.on_disk.pop(key, None)
+                self.archived[key] = (status, partition)
+                archived.append(key)
+            if len(archived) > 0:
+                self.store.delete_many(archived)
+                metrics.inc("store_writes", len(archived))
+        logger.info(f"moved {len(archived)} records to the archive")
+        return len(archived)
+
     def create_file(self) -> None:
         """
         write the default config to the config file.
         :return: None
         """
-        json.dump({}, open(self.file_path, "w"))
+        atomic_write_json(self.file_path, {})
 
     def save_file(self) -> None:
         """
-        save the whitelisted players into file.
+        fold the journal into a new snapshot of the whitelisted players, in the background.
         :return:
         """
-        json.dump(self.whitelist, open(self.file_path, "w"))
+        self.store.compact()
+
+    def close(self) -> None:
+        """
+        write a last snapshot and release the file handles.
+        :return: None
+        """
+        self.store.close()
+        if self.sync is not None:
+            self.sync.close()
 
 
 class DiscordBot(Bot):
@@ -178,14 +689,95 @@ class DiscordBot(Bot):
     Discord bot written by boubou_19 for the GTNH Team.
     """
 
-    def __init__(self, *args: Any, **kwargs: Any) -> None:
-        intents = discord.Intents.all()
+    def __init__(self, *args: Any, config: Config | None = None, **kwargs: Any) -> None:
+        # the config decides the intents, so it's loaded first, and the problems found in it are logged to stderr
+        # until it tells where the log file is
+        if config is None:
+            setup_early_logging()
+        self.config = config or Config()
+        self.data_dir = get_data_dir(self.config)
+        setup_logging(self.config, self.data_dir / "bot.log")
+        if self.config["lean_mode"]:
+            # only the events the whitelist flow needs, no member cache and no member chunking at startup: members
+            # are fetched when needed
+            intents = discord.Intents.none()
+            intents.guilds = True
+            intents.members = True
+            intents.guild_messages = True
+            intents.dm_messages = True
+            intents.message_content = True
+            intents.guild_reactions = True
+            kwargs.update(member_cache_flags=discord.MemberCacheFlags.none(), chunk_guilds_at_startup=False)
+        else:
+            intents = discord.Intents.all()
         Bot.__init__(self, command_prefix="!", intents=intents, *args, **kwargs)
-        self.config = Config()
-        self.whitelist = WhitelistedPlayers()
-        self.QUESTIONS = 10
+        self.whitelist = WhitelistedPlayers(self.config)
         self.TIMEOUT = 300
-        self.current_users: Dict[Any, Any] = dict()
+        self.questions_path = self.data_dir / self.config["questions_file"] if self.config["questions_file"] else None
+        try:
+            self.questions: List[Question] = load_questions(self.questions_path)
+        except (OSError, ValueError) as e:
+            logger.error(f"failed to load the questions from {self.questions_path}: {e}")
+            sys.exit(1)
+        self.router = MessageRouter()
+        self.sessions = SessionStore(
+            self.data_dir / "sessions.json",
+            self.data_dir / "sessions.journal",
+            compact_every=self.config["journal_compact_every"],
+        )
+        self.commands_cog: CommandsCog | None = None
+        self.channels = ChannelResolver(
+            guild_id=int(self.config["guild_id"]),
+            channel_ids={
+                "pending_app": [int(self.config["pending_app"])],
+                "rejected_app": [int(self.config["rejected_app"])],
+                "validated_app": [int(self.config["validated_app"])],
+                "console": [int(channel_id) for channel_id in self.config["console channels"]],
+            },
+        )
+        self.console = ConsoleDispatcher(
+            get_channels=lambda: self.channels.get_all("console"),  # type: ignore
+            batch_window=self.config["console_batch_window"],
+            max_retries=self.config["console_max_retries"],
+        )
+        self.outbox_stats = OutboxStats()
+        self.live_sessions = SessionRegistry(max_size=self.config["max_live_sessions"], idle_timeout=self.config["session_idle_timeout"])
+        self.admission = AdmissionController(max_active=self.config["max_active_interviews"], update_interval=self.config["queue_update_interval"])
+        self.mojang = MojangResolver(
+            api_url=self.config["mojang_api_url"],
+            timeout=self.config["mojang_timeout"],
+            cache_size=self.config["mojang_cache_size"],
+            cache_ttl=self.config["mojang_cache_ttl"],
+            negative_cache_ttl=self.config["mojang_negative_cache_ttl"],
+            batch_window=self.config["mojang_batch_window"],
+        )
+
+        metrics.enabled = self.config["perf_enabled"]
+        if metrics.enabled:
+            metrics.collectors.append(self.collect_metrics)
+            self.http.request = metrics.timed("discord_rest")(self.http.request)  # type: ignore
+
+    def collect_metrics(self) -> Dict[str, float]:
+        """
+        Gather the counters kept by the components of the bot, for the metrics.
+        :return: name -> value
+        """
+        values: Dict[str, float] = {f"sessions_{reason.replace(' ', '_')}": count for reason, count in self.live_sessions.lifecycle.items()}
+        values.update(
+            sessions_live=len(self.live_sessions),
+            interviews_active=len(self.admission.active),
+            interviews_queued=len(self.admission.waiting),
+            mojang_lookups=self.mojang.metrics.lookups,
+            mojang_requests=self.mojang.metrics.requests,
+            mojang_rate_limited=self.mojang.metrics.rate_limited,
+            mojang_errors=self.mojang.metrics.errors,
+            dm_messages=self.outbox_stats.messages,
+            dm_api_calls=self.outbox_stats.api_calls,
+            console_queue_depth=self.console.depth,
+            console_messages_sent=self.console.sent,
+            console_messages_failed=self.console.failed,
+        )
+        return values
 
     async def on_ready(self) -> None:
         """
@@ -198,10 +790,69 @@ class DiscordBot(Bot):
         await super().change_presence(activity=discord.Game(activity_text), status=discord.enums.Status.dnd)
         logger.info(f"set activity to {activity_text}.")
 
-        await self.add_cog(CommandsCog(self))
-        logger.info("loaded the command_cog cog")
+        for missing in self.channels.resolve(self):
+            logger.error(f"the {missing} channel set in the config doesn't exist or can't be seen by the bot")
+
+        # on_ready is called again after a reconnection
+        if self.commands_cog is None:
+            self.commands_cog = CommandsCog(self)
+            await self.add_cog(self.commands_cog)
+            logger.info("loaded the command_cog cog")
+
+            self.console.start()
+            start_monitoring(self.config["perf_loop_lag_interval"], self.config["perf_prometheus_file"], self.config["perf_dump_interval"])
+            await self.resume_interviews()
+            asyncio.ensure_future(self.commands_cog.reconcile_pending_channel())
+            if self.config["archive_after_days"] > 0:
+                asyncio.ensure_future(self.archive_records())
+
+    async def archive_records(self) -> None:
+        """
+        Move the old approved and rejected applications to the archive, every archive_interval, forever.
+        :return: None
+        """
+        while True:
+            try:
+                await self.whitelist.archive_old_records(self.config["archive_after_days"] * 86400)
+            except Exception as e:
+                logger.error(f"failed to archive the old applications: {e!r}")
+            await asyncio.sleep(self.config["archive_interval"])
 
-    async def question_name(self, channel: discord.abc.Messageable, user: User | Member) -> Tuple[str, str]:
+    async def get_or_fetch_user(self, user_id: int) -> User | None:
+        """
+        Get a user from the cache, or from the API if it isn't cached (e.g. in lean mode).
+        :param user_id: the id of the user
+        :return: the user, or None if it doesn't exist
+        """
+        user = self.get_user(user_id)
+        if user is None:
+            try:
+                user = await self.fetch_user(user_id)
+            except discord.NotFound:
+                return None
+        return user
+
+    async def on_guild_channel_create(self, channel: discord.abc.GuildChannel) -> None:
+        self.channels.set(channel)
+
+    async def on_guild_channel_update(self, before: discord.abc.GuildChannel, after: discord.abc.GuildChannel) -> None:
+        self.channels.set(after)
+
+    async def on_guild_channel_delete(self, channel: discord.abc.GuildChannel) -> None:
+        self.channels.remove(channel)
+
+    async def wait_answer(self, channel: DMWriter, user: User | Member, timeout: float) -> discord.Message:
+        """
+        Send the queued messages, then wait for the next message of the user.
+        :param channel: the writer of the DM channel used to talk to the user
+        :param user: the user
+        :param timeout: maximum time to wait, in seconds
+        :return: the message
+        """
+        await channel.flush()
+        return await self.router.next_message(user.id, channel.id, timeout=timeout)
+
+    async def question_name(self, channel: DMWriter, user: User | Member) -> Tuple[str, str]:
         """
         Method to ask the username of the player on minecraft.
         :param channel: The DM channel used to talk to the user
@@ -217,114 +868,81 @@ class DiscordBot(Bot):
         )
 
         # loop here until we get a valid name. We can't prevent the user from applying with an account he doesn't own :(
-        faulty = True
-        while faulty:
-            msg = await super().wait_for("message", check=lambda message: message.author == user, timeout=self.TIMEOUT)
+        profile: MojangProfile | None = None
+        while profile is None:
+            msg = await self.wait_answer(channel, user, timeout=self.TIMEOUT)
 
             # for when the user reaches the timeout but still send one answer, triggering the bot then type next
             if msg.content.lower() == "next":
                 await channel.send(f"I doubt your character is named {msg.content.lower()}. " "Please enter your real name")
                 continue
 
-            res = requests.get(f"https://api.mojang.com/users/profiles/minecraft/{msg.content}")
-            faulty = res.status_code != 200
+            try:
+                with metrics.timer("mojang_resolve"):
+                    profile = await self.mojang.resolve(msg.content)
+            except MojangAPIError as e:
+                logger.warning(e)
+                await channel.send("Mojang's API isn't answering right now. Please send me your name again in a moment.")
+                continue
 
-            if faulty:
+            if profile is None:
                 await channel.send(f"looks like i can't find you on Mojang's API. Be sure to have " f"typed your name correctly, and only your name")
 
-        res = res.json()
-        name: str = res["name"]
-        uuid: str = res["id"]
-        return name, uuid
+        return profile.name, profile.uuid
 
-    async def int_question(self, question: str, channel: discord.abc.Messageable, user: User | Member) -> List[str]:
+    async def ask_question(self, question: Question, channel: DMWriter, user: User | Member) -> Any:
         """
-        Helper function to ask about a integer question.
-        :param question: question to ask.
-        :param channel: the channel of the discussion.
-        :param user: the user being asked the question.
-        :return:
+        Ask a question, and read the answer with the handler of its type.
+        :param question: the question to ask
+        :param channel: the writer of the DM channel used to talk to the user
+        :param user: the user being asked the question
+        :return: the answer, typed by the handler
         """
-        await channel.send(question)
+        handler = handlers[question.question_type]
+        await channel.send(question.text + handler.suffix)
 
-        # wait for a message from the user
-        msg = await super().wait_for("message", check=lambda message: message.author == user, timeout=self.TIMEOUT)
-        pattern = re.compile("-?[0-9]+")
-        result = re.findall(pattern, msg.content)
-
-        return result
-
-    async def boolean_question(self, question: str, channel: discord.abc.Messageable, user: User | Member) -> bool:
-        """
-        Helper function to ask for a boolean question.
-        :param question: question to ask
-        :param channel: the private channel between the bot and the user.
-        :param user: the user.
-        :return: bool
-        """
-        # check that will filter any message that is not from the user or that is not yes or no.
-        check_yes_no = lambda message: message.author == user and message.content.upper() in ["YES", "NO"]
-        await channel.send(question + " Type YES or NO to validate.")
-        msg = await super().wait_for("message", check=check_yes_no, timeout=self.TIMEOUT)
-        return msg.content.upper() == "YES"  # type: ignore
-
-    async def free_question(self, question: str, channel: discord.abc.Messageable, user: User | Member) -> str:
-        """
-        Helper function to ask for an open question.
-        :param question: question to ask
-        :param channel: the private channel between the bot and the user.
-        :param user: the user.
-        :return: str
-        """
-
-        result = []
-        await channel.send(question + " Type NEXT to validate.")
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.TIMEOUT
+        parts: List[str] = []
         while True:
-            msg = await super().wait_for("message", check=lambda message: message.author == user, timeout=self.TIMEOUT)
-            if "NEXT" in msg.content.upper():
-                if len(msg.content) != len("NEXT"):
-                    result.append(re.sub("next", "", msg.content, flags=re.IGNORECASE))
-                return " ".join(result)
-            else:
-                result.append(msg.content)
+            msg = await self.wait_answer(channel, user, timeout=self.TIMEOUT if handler.restart_timeout else deadline - loop.time())
+            answer = handler.read(parts, msg.content)
+            if answer is not None:
+                return answer
 
-    def make_application_embed_pending(self, user_dict: Any) -> discord.Embed:
+    def make_application_embed_pending(self, record: Application) -> discord.Embed:
         """
-        method to build a pending embed from a dictionnary containing the pending informations
-        :param user_dict: dictionary containing the pending informations
+        method to build a pending embed from the record of an application
+        :param record: the record of the application
         :return: Embed
         """
-        title = f"""{user_dict['author']["name"]}'s (Minecraft character: {user_dict['name']}) application"""
+        title = f"""{record.author_name}'s (Minecraft character: {record.name}) application"""
+        # the answers of the questions that aren't in the questionnaire anymore aren't shown
+        answers = "".join(f"__**{question.label}**__: {question.show(record.answers.get(question.name))}\n\n" for question in self.questions)
         description = f"""
-__**Minecraft Name**__: {safify(user_dict["name"])}
-
-__**Age**__: {user_dict["age"][0]}
+__**Minecraft Name**__: {safify(record.name or "")}
 
-__**Has read and understood rules?**__: {":white_check_mark:" if user_dict["read rules"] else ":x:"}
-
-__**Has agreed to be punished/banned if they break the rules?**__: {":white_check_mark:" if user_dict["punishment"] else ":x:"} 
-
-__**Ban history**__: {safify(user_dict["ban"])}
-
-__**Where did they hear about the pack**__: {safify(user_dict["referal"])}
-
-__**A bit about theirselves (3 sentences min)**__: {safify(user_dict["personality"])}
-
-__**Discord id**__: {user_dict["author"]["id"]}
+{answers}__**Discord id**__: {record.author_id}
 
 """
 
         color = 0xFFA500
-        url = f"https://mcuuid.net/?q={user_dict['name']}"
+        url = f"https://mcuuid.net/?q={record.name}"
         embed = discord.Embed(title=title, url=url, description=description, color=color)
-        user = super().get_user(user_dict["author"]["id"])
-        assert user
-        if user.avatar is not None:
+        user = super().get_user(record.author_id) if record.author_id is not None else None
+        if user is None:
+            embed.set_author(name=record.author_name)
+        elif user.avatar is not None:
             embed.set_author(name=user.name, icon_url=user.avatar.url)
         else:
             embed.set_author(name=user.name)
-        embed.set_thumbnail(url=f"https://crafthead.net/avatar/{user_dict['uuid'].replace('-', '')}")
-        embed.set_footer(text=f"application made the {user_dict['date']}")
+        embed.set_thumbnail(url=f"https://crafthead.net/avatar/{(record.uuid or '').replace('-', '')}")
+        submitted = record.timestamps.get("submitted")
+        if submitted is not None:
+            date = f"{datetime.datetime.fromtimestamp(submitted, datetime.timezone.utc).strftime('%b %d %Y %H:%M:%S')} UTC"
+        else:
+            date = record.date or "?"
+        embed.set_footer(text=f"application made the {date}")
         return embed
 
     def make_application_embed_processed(self, embed_dict: Any, rejected: bool = True) -> discord.Embed:
@@ -354,10 +972,18 @@ __**Discord id**__: {user_dict["author"]["id"]}
 
         # on DMs
         else:
-            if message.author == super().user or (message.author.id in self.whitelist and self.whitelist[message.author.id]["status"] != "rejected"):
+            # a user has at most one live interview: answers go to it, and anything sent while queued is dropped
+            live_session = self.live_sessions.get(message.author.id)
+            if live_session is not None:
+                live_session.touch()
+                self.router.dispatch(message)
                 return
 
-            channel = message.channel
+            status = self.whitelist.status(message.author.id)
+            if message.author == super().user or (status is not None and status != Status.REJECTED):
+                return
+
+            channel: discord.DMChannel = message.channel  # type: ignore
 
             # if server is full
             if self.config["whitelists_closed"]:
@@ -368,163 +994,201 @@ __**Discord id**__: {user_dict["author"]["id"]}
                 return
 
             user = message.author
-            current_user = {"author": {"name": user.display_name, "id": user.id, "discriminator": user.discriminator}, "status": "pending"}
-            self.current_users[user.id] = current_user
-
-            def age_check(possible_answers: List[int]) -> bool:
-                if len(possible_answers) != 1:
-                    return False
-
-                return 13 <= int(possible_answers[0]) <= 99
-
-            age = Question(
-                name="age",
-                text="How old are you? this will only be availiable from staff don't worry",
-                question_type=QuestionType.INTEGER,
-                checks=[age_check],
-                on_check_error=lambda _: asyncio.ensure_future(channel.send("Please write your age, in numerical form, without any other number.")),
-            )
-
-            read_rules = Question(
-                name="read rules",
-                text="Did you fully read and understood the rules? (availiable in #rules)",
-                question_type=QuestionType.BOOL,
-                checks=None,
-                on_check_error=None,
+            current_user = Application(
+                status=Status.PENDING,
+                author_name=user.display_name,
+                author_id=user.id,
+                discriminator=user.discriminator,
+                timestamps={"started": time.time()},
             )
+            session = InterviewSession(user.id, channel.id, current_user)
+            if not self.live_sessions.start(session):
+                await channel.send("I'm handling too many applications right now, please send me a message again in a few minutes.")
+                return
 
-            punishment = Question(
-                name="punishment",
-                text="Do you agree that, if you ever violate the rules, you will be punished or banned?",
-                question_type=QuestionType.BOOL,
-                checks=None,
-                on_check_error=None,
-            )
-
-            ban = Question(
-                name="ban", text="Did you get ever banned? If yes please explain.", question_type=QuestionType.FREE, checks=None, on_check_error=None
-            )
-
-            referal = Question(name="referal", text="Where did you heard of GT:NH?", question_type=QuestionType.FREE, checks=None, on_check_error=None)
-
-            personality = Question(
-                name="personality",
-                text="Please tell us a bit about yourself __**outside of Minecraft in minimum 3 sentences**__ (hobbies, personality..) ",
-                question_type=QuestionType.FREE,
-                checks=[check_3_sentences],
-                on_check_error=lambda _: asyncio.ensure_future(
-                    channel.send(
-                        "Looks like your text isn't at least 3 sentences. Friendly reminder: a sentence " "starts with a capital letter and ends with a dot."
-                    )
-                ),
-            )
-
-            question_list: List[Question] = [age, read_rules, punishment, ban, referal, personality]
-
-            self.whitelist[user.id] = current_user
-            has_already_timed_out: bool = False
             try:
-                current_user["name"], current_user["uuid"] = await self.question_name(channel, user)
-
-                for question in question_list:
-                    await channel.send("Next question:")
-                    loop = True
-                    answer: Any
-                    while loop:
-                        if question.question_type == QuestionType.FREE:
-                            answer = await self.free_question(question.text, channel, user)
-                        elif question.question_type == QuestionType.BOOL:
-                            answer = await self.boolean_question(question.text, channel, user)
-                        elif question.question_type == QuestionType.INTEGER:
-                            answer = await self.int_question(question.text, channel, user)
-                        else:
-                            error_msg = f"unknown question type: {question.question_type.value}"
-                            logger.error(error_msg)
-                            raise TypeError(error_msg)
-
-                        if question.checks is None:
-                            loop = False
-                        else:
-                            if False not in [q(answer) for q in question.checks]:
-                                loop = False
-                            else:
-                                if question.on_check_error is not None:
-                                    await question.on_check_error(None)
-
-                        current_user[question.name] = answer
-
-                current_user["date"] = f"{datetime.datetime.now().strftime('%b %d %Y %H:%M:%S')} GMT+1"
-            except asyncio.exceptions.TimeoutError:
-                if not has_already_timed_out:
-                    has_already_timed_out = True
-                    del self.whitelist[user.id]
-                    await channel.send(
-                        "It has been more than 10 mins since i received any sign of life from you, aborting "
-                        "the whitelisting process. Resend me a message to start again the whitelisting "
-                        "process."
-                    )
-                return
-            except DiscordServerError:
-                del self.whitelist[user.id]
+                await self.admission.acquire(
+                    user.id,
+                    lambda position: channel.send(
+                        f"There are a lot of people applying right now. You are **#{position}** in the queue, I'll start your application as soon as "
+                        "it's your turn."
+                    ),
+                )
+            except BaseException:
+                self.live_sessions.abort(user.id)
+                raise
 
-            embed = self.make_application_embed_pending(current_user)
-            await channel.send("this is the application you have made:", embed=embed)
+            session.admitted = True
+            session.deadline = time.time() + self.TIMEOUT
+            current_user.timestamps["admitted"] = time.time()
+            self.whitelist[user.id] = current_user
+            self.sessions.checkpoint(session)
+            await self.run_interview(session, user, channel)
 
-            if not current_user["read rules"]:
-                await channel.send(
-                    "Unfortunately, we require any player to know our rules. "
-                    "Your application will not be transmitted. If this is a mistake, start the whitelisting "
-                    "process again by sending me a new message."
-                )
+    async def run_interview(self, session: InterviewSession, user: User | Member, channel: discord.DMChannel) -> None:
+        """
+        Ask the remaining steps of an interview, checkpointing the session after each answer, then submit the
+        application.
+        :param session: the session of the interview
+        :param user: the user
+        :param channel: the DM channel used to talk to the user
+        :return: None
+        """
+        bind(user_id=user.id, session=f"{user.id}-{channel.id}")
+        writer = DMWriter(channel, self.config["dm_flush_window"], self.outbox_stats)
+        current_user = session.record
+        # a reload of the questions doesn't change the interviews already running
+        question_list = self.questions
+
+        has_already_timed_out: bool = False
+        self.router.open(user.id, channel.id)
+        try:
+            if session.step == 0:
+                current_user.name, current_user.uuid = await self.question_name(writer, user)
+                session.advance(self.TIMEOUT)
+                self.sessions.checkpoint(session)
+
+            # the questions are matched by name: the answers given before a restart are kept even if the questionnaire
+            # changed since
+            for question in [question for question in question_list if question.name not in current_user.answers]:
+                await writer.send("Next question:")
+                answer = await self.ask_question(question, writer, user)
+                while not question.validate(answer):
+                    if question.error is not None:
+                        await writer.send(question.error)
+                    answer = await self.ask_question(question, writer, user)
+                current_user.answers[question.name] = handlers[question.question_type].store(answer)
+
+                session.advance(self.TIMEOUT)
+                self.sessions.checkpoint(session)
+
+            current_user.timestamps["submitted"] = time.time()
+        except asyncio.exceptions.TimeoutError:
+            self.sessions.discard(user.id)
+            self.live_sessions.timeout(user.id)
+            if not has_already_timed_out:
+                has_already_timed_out = True
                 del self.whitelist[user.id]
-                return
-
-            if not current_user["punishment"]:
-                await channel.send(
-                    "Unfortunately, you have to accept that breaking a rule have consequences on the server. "
-                    "Your application will not be transmitted. If this is a mistake, start the whitelisting "
-                    "process again by sending me a new message."
+                await writer.send(
+                    "It has been more than 10 mins since i received any sign of life from you, aborting "
+                    "the whitelisting process. Resend me a message to start again the whitelisting "
+                    "process."
                 )
+            return
+        except DiscordServerError:
+            self.sessions.discard(user.id)
+            self.live_sessions.abort(user.id)
+            del self.whitelist[user.id]
+            return
+        except Exception:
+            # a failed interview must not stay live, nor be resumed at the next start
+            logger.exception(f"the interview of {user.id} failed")
+            self.sessions.discard(user.id)
+            self.live_sessions.abort(user.id)
+            if self.whitelist.status(user.id) == Status.PENDING:
                 del self.whitelist[user.id]
+            raise
+        finally:
+            self.router.close(user.id, channel.id)
+            self.admission.release(user.id)
+
+        self.sessions.discard(user.id)
+        embed = self.make_application_embed_pending(current_user)
+        await writer.send("this is the application you have made:", embed=embed)
+
+        for question in question_list:
+            if question.refusal is not None and not current_user.answers.get(question.name):
+                await writer.send(question.refusal)
+                del self.whitelist[user.id]
+                self.live_sessions.abort(user.id)
                 return
 
-            self.whitelist[user.id] = current_user
-            await self.send_pending(embed)
-            self.whitelist.save_file()
-            await channel.send(
-                "Your application has been sent for review. __**Please wait at least 24h before asking "
-                "about any update on your application. Sometimes we are all busy.**__"
-            )
+        self.whitelist[user.id] = current_user
+        self.live_sessions.complete(user.id)
+        await self.send_pending(embed, user.id)
+        await writer.send(
+            "Your application has been sent for review. __**Please wait at least 24h before asking "
+            "about any update on your application. Sometimes we are all busy.**__"
+        )
+
+    async def resume_interviews(self) -> None:
+        """
+        Resume the interviews that were ongoing when the bot stopped.
+        :return: None
+        """
+        sessions = self.sessions.load()
+        # route the answers right away, before the users get their resume message
+        for session in sessions:
+            self.router.open(session.user_id, session.channel_id)
 
-    async def send_pending(self, embed: discord.Embed) -> None:
+        for session in sessions:
+            channel: discord.DMChannel | None = None
+            try:
+                user = await self.get_or_fetch_user(session.user_id)
+                if user is not None:
+                    channel = user.dm_channel or await user.create_dm()
+            except discord.HTTPException as e:
+                logger.error(f"couldn't resume the interview of {session.user_id}: {e}")
+                user = None
+
+            # the deadline was reached long before the bot came back
+            expired = session.deadline + self.config["session_resume_window"] < time.time()
+            if user is None or channel is None or expired:
+                self.router.close(session.user_id, session.channel_id)
+                self.sessions.discard(session.user_id)
+                if self.whitelist.status(session.user_id) == Status.PENDING:
+                    del self.whitelist[session.user_id]
+                continue
+
+            # the step counts the questions of the current questionnaire already answered
+            if session.step > 0:
+                session.step = 1 + len([question for question in self.questions if question.name in session.record.answers])
+            logger.info(f"resuming the interview of {session.user_id} at step {session.step}")
+            self.admission.admit(session.user_id)
+            session.admitted = True
+            self.live_sessions.start(session)
+            await channel.send("Sorry, I had to restart. Let's continue where we stopped.")
+            asyncio.ensure_future(self.run_interview(session, user, channel))
+
+    @metrics.timed("send_pending")
+    async def send_pending(self, embed: discord.Embed, user_id: int) -> None:
         """
-        Helper function to send an embed to the pending app channel
+        Helper function to send an embed to the pending app channel, and index the message of the application
         :param embed: a discord Embed
+        :param user_id: the discord id of the applicant
         :return: None
         """
-        guild = self.get_guild(int(self.config["guild_id"]))
-        channel: TextChannel = guild.get_channel(int(self.config["pending_app"]))  # type: ignore
-        await channel.send(embed=embed)
+        message = await self.channels.get("pending_app").send(embed=embed)
+        self.whitelist.update(user_id, pending_message_id=message.id)
 
+    @metrics.timed("send_rejected")
     async def send_rejected(self, embed: discord.Embed) -> None:
         """
         Helper function to send an embed to the rejected app channel
         :param embed: a discord Embed
         :return: None
         """
-        guild = self.get_guild(int(self.config["guild_id"]))
-        channel: TextChannel = guild.get_channel(int(self.config["rejected_app"]))  # type: ignore
-        await channel.send(embed=embed)
+        await self.channels.get("rejected_app").send(embed=embed)
 
+    @metrics.timed("send_validated")
     async def send_validated(self, embed: discord.Embed) -> None:
         """
         Helper function to send an embed to the approved app channel
         :param embed: a discord Embed
         :return: None
         """
-        guild = self.get_guild(int(self.config["guild_id"]))
-        channel: TextChannel = guild.get_channel(int(self.config["validated_app"]))  # type: ignore
-        await channel.send(embed=embed)
+        await self.channels.get("validated_app").send(embed=embed)
+
+    async def close(self) -> None:
+        """
+        Method called when the bot is shutting down.
+        :return: None
+        """
+        await self.console.stop()
+        await self.mojang.close()
+        await asyncio.get_running_loop().run_in_executor(None, self.whitelist.close)
+        await asyncio.get_running_loop().run_in_executor(None, self.sessions.close)
+        await super().close()
 
     def run(self, *args: Any, **kwargs: Any) -> None:
         """
@@ -533,6 +1197,8 @@ __**Discord id**__: {user_dict["author"]["id"]}
         :param kwargs: Bot's **kwargs
         :return: None
         """
+        # discord.py logs through the handlers of setup_logging instead of its own
+        kwargs.setdefault("log_handler", None)
         super().run(self.config["token"], *args, **kwargs)
 
     async def send_whitelist_command(self, username: str) -> None:
@@ -541,11 +1207,18 @@ __**Discord id**__: {user_dict["author"]["id"]}
         :param username: minecraft username
         :return: None
         """
-        for channel_id in self.config["console channels"]:
-            guild = self.get_guild(int(self.config["guild_id"]))
-            channel: TextChannel = guild.get_channel(channel_id)  # type: ignore
-            username = username.replace("\\_", "_").replace("\_", "_")
-            await channel.send(f"whitelist add {username}")
+        await self.send_whitelist_commands([username])
+
+    async def send_whitelist_commands(self, usernames: List[str]) -> None:
+        """
+        Method used by the bot to queue a whitelist add <username> for several users in every console channel set in
+        the config. The commands are sent in the background by the console dispatcher. Nothing is posted when the
+        whitelist files of the servers are written directly instead.
+        :param usernames: minecraft usernames
+        :return: None
+        """
+        if self.config["whitelist_sync_mode"] != "file":
+            self.console.enqueue(usernames)
 
 
 if __name__ == "__main__":
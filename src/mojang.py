@@ -0,0 +1,298 @@
+import asyncio
+import logging
+import re
+import time
+from collections import Counter, OrderedDict
+from typing import Dict, Generic, List, NamedTuple, Optional, Tuple, TypeVar
+
+import aiohttp
+
+logger = logging.getLogger("bot - mojang")
+
+# minecraft names are 3 to 16 chars long, but some legacy accounts are shorter
+name_pattern = re.compile("^[A-Za-z0-9_]{1,16}$")
+
+# maximum amount of names accepted by Mojang's bulk profiles endpoint
+max_batch_size = 10
+
+T = TypeVar("T")
+
+
+class MojangProfile(NamedTuple):
+    name: str
+    uuid: str
+
+
+class MojangAPIError(Exception):
+    """
+    Raised when Mojang's API couldn't give a definitive answer (timeout, rate limit, server error).
+    """
+
+
+class TTLCache(Generic[T]):
+    """
+    Small LRU cache where every entry expires after its own time to live.
+    """
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size: int = max_size
+        self.entries: OrderedDict[str, Tuple[float, T]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, key: str) -> Tuple[bool, Optional[T]]:
+        """
+        Get an entry from the cache.
+        :param key: the key of the entry
+        :return: a tuple (hit, value). The value is only meaningful if hit is True.
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            return False, None
+
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self.entries[key]
+            return False, None
+
+        self.entries.move_to_end(key)
+        return True, value
+
+    def set(self, key: str, value: T, ttl: float) -> None:
+        """
+        Add an entry to the cache, evicting the least recently used one if the cache is full.
+        :param key: the key of the entry
+        :param value: the value of the entry
+        :param ttl: time to live of the entry, in seconds
+        :return: None
+        """
+        if ttl <= 0:
+            return
+        self.entries[key] = (time.monotonic() + ttl, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self.entries.clear()
+
+
+class MojangMetrics:
+    """
+    Counters about the requests made to Mojang's API.
+    """
+
+    def __init__(self) -> None:
+        self.lookups: int = 0
+        self.requests: int = 0
+        self.names_requested: int = 0
+        self.rate_limited: int = 0
+        self.errors: int = 0
+        self.batch_sizes: Counter[int] = Counter()
+
+    @property
+    def requests_saved(self) -> int:
+        """
+        Number of requests avoided by batching, compared to one request per name.
+        :return: int
+        """
+        return self.names_requested - self.requests
+
+    def summary(self) -> str:
+        """
+        Human readable summary of the metrics.
+        :return: str
+        """
+        batches = ", ".join(f"{size}: {count}" for size, count in sorted(self.batch_sizes.items())) or "none"
+        saved_ratio = 100 * self.requests_saved / self.names_requested if self.names_requested else 0
+        return (
+            f"lookups: {self.lookups}\n"
+            f"names sent to Mojang: {self.names_requested}\n"
+            f"requests made: {self.requests} (rate limited: {self.rate_limited}, errors: {self.errors})\n"
+            f"requests saved by batching: {self.requests_saved} ({saved_ratio:.1f}% of the rate limit budget)\n"
+            f"batch sizes (size: count): {batches}"
+        )
+
+
+class MojangResolver:
+    """
+    Asynchronous name -> profile resolver for Mojang's API.
+
+    It shares a single keep-alive HTTP session between all the lookups, caches both found and unknown names, and
+    coalesces concurrent lookups of the same name into a single request. If batch_window is positive, the lookups
+    arriving within that window are sent together to the bulk profiles endpoint.
+    """
+
+    def __init__(
+        self, api_url: str, timeout: float, cache_size: int, cache_ttl: float, negative_cache_ttl: float, batch_window: float = 0, max_connections: int = 10
+    ) -> None:
+        self.api_url: str = api_url.rstrip("/")
+        self.timeout: float = timeout
+        self.cache_ttl: float = cache_ttl
+        self.negative_cache_ttl: float = negative_cache_ttl
+        self.max_connections: int = max_connections
+        self.cache: TTLCache[Optional[MojangProfile]] = TTLCache(cache_size)
+        self.in_flight: Dict[str, "asyncio.Future[Optional[MojangProfile]]"] = dict()
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.batch_window: float = batch_window
+        self.pending: Dict[str, Tuple[str, "asyncio.Future[Optional[MojangProfile]]"]] = dict()
+        self.flush_handle: Optional[asyncio.TimerHandle] = None
+        self.metrics = MojangMetrics()
+
+    def get_session(self) -> aiohttp.ClientSession:
+        """
+        Get the shared HTTP session, creating it if needed. Must be called from within the event loop.
+        :return: the session
+        """
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_connections, keepalive_timeout=60)
+            self.session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self.session
+
+    async def close(self) -> None:
+        """
+        Close the shared HTTP session.
+        :return: None
+        """
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+        self.session = None
+
+    async def resolve(self, name: str) -> Optional[MojangProfile]:
+        """
+        Resolve a minecraft name into its profile.
+        :param name: the minecraft name
+        :return: the profile, or None if no account has this name
+        :raise MojangAPIError: if Mojang's API couldn't be reached or didn't answer properly
+        """
+        name = name.strip()
+        if name_pattern.match(name) is None:
+            return None
+
+        key = name.lower()
+        self.metrics.lookups += 1
+        hit, profile = self.cache.get(key)
+        if hit:
+            return profile
+
+        future = self.in_flight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self.fetch(name) if self.batch_window <= 0 else self.enqueue(name))
+            self.in_flight[key] = future
+            future.add_done_callback(lambda _: self.in_flight.pop(key, None))
+
+        # shield the shared request so a waiter timing out doesn't cancel it for the other waiters
+        return await asyncio.shield(future)
+
+    async def fetch(self, name: str) -> Optional[MojangProfile]:
+        """
+        Query Mojang's API for a single name and cache the result.
+        :param name: the minecraft name
+        :return: the profile, or None if no account has this name
+        :raise MojangAPIError: if Mojang's API couldn't be reached or didn't answer properly
+        """
+        self.metrics.requests += 1
+        self.metrics.names_requested += 1
+        try:
+            async with self.get_session().get(f"{self.api_url}/users/profiles/minecraft/{name}") as res:
+                if res.status in (204, 404):
+                    self.cache.set(name.lower(), None, self.negative_cache_ttl)
+                    return None
+
+                self.check_status(res.status)
+                data = await res.json(content_type=None)
+            profile = MojangProfile(name=data["name"], uuid=data["id"])
+        except asyncio.TimeoutError as e:
+            self.metrics.errors += 1
+            raise MojangAPIError(f"timed out after {self.timeout}s while looking up {name}") from e
+        except aiohttp.ClientError as e:
+            self.metrics.errors += 1
+            raise MojangAPIError(f"error while looking up {name}: {e}") from e
+        except (ValueError, KeyError, TypeError) as e:
+            self.metrics.errors += 1
+            raise MojangAPIError(f"invalid response from Mojang's API while looking up {name}: {e!r}") from e
+
+        self.cache.set(name.lower(), profile, self.cache_ttl)
+        return profile
+
+    def check_status(self, status: int) -> None:
+        """
+        Raise an error if the status of a response isn't a success.
+        :param status: the HTTP status of the response
+        :return: None
+        :raise MojangAPIError: if the status isn't 200
+        """
+        if status == 200:
+            return
+
+        if status == 429:
+            self.metrics.rate_limited += 1
+        else:
+            self.metrics.errors += 1
+        raise MojangAPIError(f"unexpected status {status} from Mojang's API")
+
+    def enqueue(self, name: str) -> "asyncio.Future[Optional[MojangProfile]]":
+        """
+        Add a name to the next batch. The batch is sent when the batch window ends or when it is full.
+        :param name: the minecraft name
+        :return: a future resolved with the profile of the name
+        """
+        loop = asyncio.get_running_loop()
+        future: "asyncio.Future[Optional[MojangProfile]]" = loop.create_future()
+        self.pending[name.lower()] = (name, future)
+
+        if len(self.pending) >= max_batch_size:
+            self.flush_batch()
+        elif self.flush_handle is None:
+            self.flush_handle = loop.call_later(self.batch_window, self.flush_batch)
+        return future
+
+    def flush_batch(self) -> None:
+        """
+        Send the pending names to Mojang's API.
+        :return: None
+        """
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+
+        batch, self.pending = self.pending, dict()
+        if len(batch) > 0:
+            asyncio.ensure_future(self.fetch_batch(batch))
+
+    async def fetch_batch(self, batch: Dict[str, Tuple[str, "asyncio.Future[Optional[MojangProfile]]"]]) -> None:
+        """
+        Query Mojang's bulk profiles endpoint for a batch of names, then resolve the future of each name.
+        :param batch: dict of lowercased name -> (name, future)
+        :return: None
+        """
+        self.metrics.requests += 1
+        self.metrics.names_requested += len(batch)
+        self.metrics.batch_sizes[len(batch)] += 1
+        names: List[str] = [name for name, _ in batch.values()]
+        error: Optional[MojangAPIError] = None
+        try:
+            async with self.get_session().post(f"{self.api_url}/profiles/minecraft", json=names) as res:
+                self.check_status(res.status)
+                data = await res.json(content_type=None)
+
+            # the endpoint only returns the names that exist
+            found: Dict[str, MojangProfile] = {entry["name"].lower(): MojangProfile(name=entry["name"], uuid=entry["id"]) for entry in data}
+            for key, (_, future) in batch.items():
+                profile = found.get(key)
+                self.cache.set(key, profile, self.cache_ttl if profile is not None else self.negative_cache_ttl)
+                if not future.done():
+                    future.set_result(profile)
+        except (asyncio.TimeoutError, aiohttp.ClientError, MojangAPIError) as e:
+            if not isinstance(e, MojangAPIError):
+                self.metrics.errors += 1
+            error = MojangAPIError(f"error while looking up {', '.join(names)}: {e or 'timeout'}")
+        except Exception as e:
+            self.metrics.errors += 1
+            error = MojangAPIError(f"invalid response from Mojang's API while looking up {', '.join(names)}: {e!r}")
+        finally:
+            # no waiter is left hanging, whatever happened, even if the task is cancelled
+            for _, future in batch.values():
+                if not future.done():
+                    future.set_exception(error or MojangAPIError(f"the lookup of {', '.join(names)} was interrupted"))
@@ -0,0 +1,145 @@
+import asyncio
+import logging
+from typing import List, Optional
+
+import discord
+
+logger = logging.getLogger("bot - outbox")
+
+# maximum length of a discord message
+max_message_length = 2000
+
+
+class OutboxStats:
+    """
+    Counters of the messages written by the DM writers, and of the API calls it took to send them.
+    """
+
+    def __init__(self) -> None:
+        self.messages: int = 0
+        self.api_calls: int = 0
+
+    @property
+    def calls_saved(self) -> int:
+        return self.messages - self.api_calls
+
+
+def safify(msg: str) -> str:
+    return msg.replace("~", "\\~").replace("|", "\\|").replace("*", "\\*").replace("_", "\\_")
+
+
+def split_message(parts: List[str]) -> List[str]:
+    """
+    Join some messages into as few messages as possible, without going over the length limit of discord.
+    :param parts: the messages, in order
+    :return: the merged messages, in order
+    """
+    chunks: List[str] = []
+    current = ""
+    for part in parts:
+        # a single message over the limit is cut, like discord would refuse it anyway
+        while len(part) > max_message_length:
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(part[:max_message_length])
+            part = part[max_message_length:]
+
+        if not current:
+            current = part
+        elif len(current) + 1 + len(part) <= max_message_length:
+            current = f"{current}\n{part}"
+        else:
+            chunks.append(current)
+            current = part
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+class DMWriter:
+    """
+    Writes to the DM channel of an interview, merging the messages sent within a short window into a single API call.
+
+    It can be used in place of the channel: send() only buffers the message, which goes out when the window ends, when
+    an embed is sent, or when flush() is called. Call flush() before waiting for an answer, so the user isn't kept
+    waiting for the question.
+    """
+
+    def __init__(self, channel: discord.DMChannel, flush_window: float, stats: OutboxStats) -> None:
+        self.channel: discord.DMChannel = channel
+        self.flush_window: float = flush_window
+        self.stats: OutboxStats = stats
+        self.buffer: List[str] = []
+        self.flush_handle: Optional[asyncio.TimerHandle] = None
+        # the task of the running timed flush, kept so it isn't garbage collected before it ends
+        self.flush_task: Optional[asyncio.Task[None]] = None
+        self.lock = asyncio.Lock()
+
+    @property
+    def id(self) -> int:
+        return self.channel.id
+
+    async def send(self, content: Optional[str] = None, embed: Optional[discord.Embed] = None) -> None:
+        """
+        Queue a message.
+        :param content: the text of the message
+        :param embed: an embed to attach. The messages queued so far are sent right away along with it.
+        :return: None
+        """
+        self.stats.messages += 1
+        if content:
+            self.buffer.append(content)
+
+        if embed is not None:
+            await self.flush(embed=embed)
+        elif self.flush_handle is None:
+            self.flush_handle = asyncio.get_running_loop().call_later(self.flush_window, self.start_timed_flush)
+
+    def start_timed_flush(self) -> None:
+        """
+        Start the flush at the end of the window, in the background.
+        :return: None
+        """
+        self.flush_handle = None
+        self.flush_task = asyncio.ensure_future(self.timed_flush())
+
+    async def timed_flush(self) -> None:
+        """
+        Flush the queued messages. Nobody awaits this flush, so its errors are logged here instead of being lost.
+        :return: None
+        """
+        try:
+            await self.flush()
+        except Exception:
+            # e.g. discord.Forbidden when the user closed their DMs
+            logger.exception(f"the timed flush of the DM channel {self.id} failed")
+        finally:
+            self.flush_task = None
+
+    async def flush(self, embed: Optional[discord.Embed] = None) -> None:
+        """
+        Send the queued messages.
+        :param embed: an embed to attach to the last message
+        :return: None
+        """
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+
+        # the lock keeps the order of the messages when a timed flush and an explicit one overlap
+        async with self.lock:
+            parts, self.buffer = self.buffer, []
+            chunks = split_message(parts)
+            if len(chunks) == 0 and embed is None:
+                return
+
+            last = chunks.pop() if chunks else None
+            for chunk in chunks:
+                await self.channel.send(chunk)
+                self.stats.api_calls += 1
+            if embed is None:
+                await self.channel.send(last)
+            else:
+                await self.channel.send(last, embed=embed)
+            self.stats.api_calls += 1
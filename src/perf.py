@@ -0,0 +1,217 @@
+import asyncio
+import bisect
+import contextlib
+import functools
+import logging
+import os
+import time
+from collections import Counter, deque
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Deque, Dict, Iterator, List, Optional, TypeVar
+
+logger = logging.getLogger("bot - perf")
+
+F = TypeVar("F", bound=Callable[..., Awaitable[Any]])
+
+# upper bounds of the histogram buckets, in seconds
+buckets = [0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]
+
+
+class Histogram:
+    """
+    Latency histogram: cumulative bucket counts for the prometheus dump, and a window of the latest samples for the
+    percentiles.
+    """
+
+    def __init__(self, window: int = 2048) -> None:
+        self.count: int = 0
+        self.sum: float = 0
+        self.max: float = 0
+        self.bucket_counts: List[int] = [0] * len(buckets)
+        self.samples: Deque[float] = deque(maxlen=window)
+
+    def observe(self, value: float) -> None:
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+        index = bisect.bisect_left(buckets, value)
+        if index < len(buckets):
+            self.bucket_counts[index] += 1
+        self.samples.append(value)
+
+    def percentile(self, p: float) -> float:
+        """
+        Get a percentile of the latest samples.
+        :param p: the percentile, between 0 and 100
+        :return: the value, 0 if there is no sample
+        """
+        if len(self.samples) == 0:
+            return 0
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+
+class Metrics:
+    """
+    In-memory latency histograms and counters of the hot paths.
+
+    When disabled, the timers and counters return right away without recording anything. Collectors are functions
+    returning counters kept elsewhere (sessions, mojang, console...), read only when the metrics are displayed.
+    """
+
+    def __init__(self) -> None:
+        self.enabled: bool = False
+        self.histograms: Dict[str, Histogram] = dict()
+        self.counters: Counter[str] = Counter()
+        self.collectors: List[Callable[[], Dict[str, float]]] = []
+
+    def observe(self, name: str, seconds: float) -> None:
+        if not self.enabled:
+            return
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram()
+        histogram.observe(seconds)
+
+    def inc(self, name: str, amount: int = 1) -> None:
+        if self.enabled:
+            self.counters[name] += amount
+
+    @contextlib.contextmanager
+    def timer(self, name: str) -> Iterator[None]:
+        """
+        Context manager timing its body.
+        :param name: the name of the histogram
+        :return: None
+        """
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def timed(self, name: str) -> Callable[[F], F]:
+        """
+        Decorator timing a coroutine function.
+        :param name: the name of the histogram
+        :return: the decorator
+        """
+
+        def decorator(function: F) -> F:
+            @functools.wraps(function)
+            async def wrapper(*args: Any, **kwargs: Any) -> Any:
+                if not self.enabled:
+                    return await function(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return await function(*args, **kwargs)
+                finally:
+                    self.observe(name, time.perf_counter() - start)
+
+            return wrapper  # type: ignore
+
+        return decorator
+
+    def collect(self) -> Dict[str, float]:
+        """
+        Get the counters, including the ones of the collectors.
+        :return: name -> value
+        """
+        values: Dict[str, float] = dict(self.counters)
+        for collector in self.collectors:
+            try:
+                values.update(collector())
+            except Exception as e:
+                logger.error(f"metrics collector failed: {e!r}")
+        return dict(sorted(values.items()))
+
+    def summary(self) -> str:
+        """
+        Format the metrics for discord.
+        :return: the text
+        """
+        lines = [f"{'name':<24} {'count':>7} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}  (ms)"]
+        for name, histogram in sorted(self.histograms.items()):
+            p50, p95, p99 = (histogram.percentile(p) * 1000 for p in (50, 95, 99))
+            lines.append(f"{name:<24} {histogram.count:>7} {p50:>8.1f} {p95:>8.1f} {p99:>8.1f} {histogram.max * 1000:>8.1f}")
+        lines.append("")
+        lines += [f"{name}: {value:g}" for name, value in self.collect().items()]
+        return "\n".join(lines)
+
+    def prometheus(self) -> str:
+        """
+        Format the metrics in the prometheus text format.
+        :return: the text
+        """
+        lines = []
+        for name, histogram in sorted(self.histograms.items()):
+            metric = f"whitelister_{name}_seconds"
+            lines.append(f"# TYPE {metric} histogram")
+            cumulative = 0
+            for bound, count in zip(buckets, histogram.bucket_counts):
+                cumulative += count
+                lines.append(f'{metric}_bucket{{le="{bound}"}} {cumulative}')
+            lines.append(f'{metric}_bucket{{le="+Inf"}} {histogram.count}')
+            lines.append(f"{metric}_sum {histogram.sum}")
+            lines.append(f"{metric}_count {histogram.count}")
+        for name, value in self.collect().items():
+            metric = f"whitelister_{name}"
+            lines.append(f"# TYPE {metric} gauge")
+            lines.append(f"{metric} {value}")
+        return "\n".join(lines) + "\n"
+
+
+# the metrics of the bot, shared by all the modules
+metrics = Metrics()
+
+
+async def monitor_loop_lag(interval: float) -> None:
+    """
+    Measure how late the event loop wakes up a task sleeping for interval, forever.
+    :param interval: the sleep interval, in seconds
+    :return: None
+    """
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        metrics.observe("loop_lag", max(0.0, time.perf_counter() - start - interval))
+
+
+def write_text(path: Path, text: str) -> None:
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "w") as file:
+        file.write(text)
+    os.replace(tmp_path, path)
+
+
+async def dump_prometheus(path: Path, interval: float) -> None:
+    """
+    Write the metrics to a file in the prometheus text format every interval, forever.
+    :param path: the path of the file, e.g. in the directory of the textfile collector of node_exporter
+    :param interval: the time between two writes, in seconds
+    :return: None
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, write_text, path, metrics.prometheus())
+        except OSError as e:
+            logger.error(f"failed to write the prometheus metrics: {e!r}")
+
+
+def start_monitoring(loop_lag_interval: float, prometheus_file: Optional[str], dump_interval: float) -> None:
+    """
+    Start the loop lag monitor, and the prometheus dump if a file is given. Does nothing when the metrics are disabled.
+    :param loop_lag_interval: the sleep interval of the loop lag monitor, in seconds
+    :param prometheus_file: the path of the prometheus file
+    :param dump_interval: the time between two writes of the prometheus file, in seconds
+    :return: None
+    """
+    if not metrics.enabled:
+        return
+    asyncio.ensure_future(monitor_loop_lag(loop_lag_interval))
+    if prometheus_file:
+        asyncio.ensure_future(dump_prometheus(Path(prometheus_file), dump_interval))
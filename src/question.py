@@ -1,5 +1,17 @@
+import json
+import re
+from dataclasses import dataclass
 from enum import Enum
-from typing import Any, Callable, List, Optional
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from src.application import Application
+from src.outbox import safify
+
+Check = Callable[[Any], bool]
+
+integer_pattern = re.compile("-?[0-9]+")
+next_pattern = re.compile("next", flags=re.IGNORECASE)
 
 
 class QuestionType(str, Enum):
@@ -8,12 +20,253 @@ class QuestionType(str, Enum):
     FREE = "free"
 
 
+@dataclass(frozen=True, slots=True)
 class Question:
-    def __init__(
-        self, name: str, text: str, question_type: QuestionType, checks: Optional[List[Callable[[Any], bool]]], on_check_error: Optional[Callable[[Any], Any]]
-    ):
-        self.name: str = name
-        self.text: str = text
-        self.question_type: QuestionType = question_type
-        self.checks: Optional[List[Callable[[Any], bool]]] = checks
-        self.on_check_error: Optional[Callable[[Any], Any]] = on_check_error
+    """
+    A question of the interview. The checks are compiled once when the questions are loaded, and the questions are
+    shared by all the interviews.
+    """
+
+    name: str
+    text: str
+    question_type: QuestionType
+    # shown in the embed of the application, the name of the question by default
+    label: str = ""
+    checks: Tuple[Check, ...] = ()
+    # sent when a check fails, before asking the question again
+    error: Optional[str] = None
+    # when set, an application with a negative answer is not transmitted, and this is sent to the user instead
+    refusal: Optional[str] = None
+
+    def validate(self, answer: Any) -> bool:
+        return all(check(answer) for check in self.checks)
+
+    def show(self, answer: Any) -> str:
+        """
+        Format an answer for the embed of the application.
+        :param answer: the answer kept in the record, None if there isn't any
+        :return: the markdown
+        """
+        return handlers[self.question_type].show(answer)
+
+
+@dataclass(frozen=True, slots=True)
+class AnswerHandler:
+    """
+    How the answers of a type of question are read.
+
+    read() gets the parts of the answer accepted so far and the content of a new message, and returns the typed answer
+    once it's complete, or None to wait for another message. store() converts a valid answer to the form kept in the
+    record, and show() formats the kept answer for the embed of the application. When restart_timeout is False, the
+    timeout applies to the whole question rather than to each message.
+    """
+
+    suffix: str
+    read: Callable[[List[str], str], Any]
+    store: Callable[[Any], Any] = lambda answer: answer
+    show: Callable[[Any], str] = lambda answer: "" if answer is None else str(answer)
+    restart_timeout: bool = True
+
+
+def read_integers(parts: List[str], content: str) -> List[int]:
+    return [int(number) for number in integer_pattern.findall(content)]
+
+
+def store_integers(numbers: List[int]) -> int | List[int]:
+    return numbers[0] if len(numbers) == 1 else numbers
+
+
+def read_bool(parts: List[str], content: str) -> Optional[bool]:
+    # any message that is not yes or no is ignored
+    content = content.upper()
+    if content in ("YES", "NO"):
+        return content == "YES"
+    return None
+
+
+def show_bool(answer: Optional[bool]) -> str:
+    return ":white_check_mark:" if answer else ":x:"
+
+
+def show_free(answer: Optional[str]) -> str:
+    # the answers are escaped, so they can't break the markdown of the embed
+    return safify(str(answer or ""))
+
+
+def read_free(parts: List[str], content: str) -> Optional[str]:
+    if "NEXT" in content.upper():
+        if len(content) != len("NEXT"):
+            parts.append(next_pattern.sub("", content))
+        return " ".join(parts)
+    parts.append(content)
+    return None
+
+
+handlers: Dict[QuestionType, AnswerHandler] = {
+    QuestionType.INTEGER: AnswerHandler(suffix="", read=read_integers, store=store_integers),
+    QuestionType.BOOL: AnswerHandler(suffix=" Type YES or NO to validate.", read=read_bool, show=show_bool, restart_timeout=False),
+    QuestionType.FREE: AnswerHandler(suffix=" Type NEXT to validate.", read=read_free, show=show_free),
+}
+
+# kind -> function building a check from its parameters in the questions file
+check_factories: Dict[str, Callable[..., Check]] = dict()
+
+
+def register_check(kind: str) -> Callable[[Callable[..., Check]], Callable[..., Check]]:
+    def decorator(factory: Callable[..., Check]) -> Callable[..., Check]:
+        check_factories[kind] = factory
+        return factory
+
+    return decorator
+
+
+@register_check("count")
+def count_check(min: int = 0, max: int | None = None) -> Check:
+    """
+    The answer must have between min and max values, e.g. the numbers of an integer question.
+    """
+    return lambda answer: min <= len(answer) and (max is None or len(answer) <= max)
+
+
+@register_check("range")
+def range_check(min: int | None = None, max: int | None = None) -> Check:
+    """
+    All the numbers of an integer answer must be between min and max.
+    """
+    return lambda answer: all((min is None or min <= value) and (max is None or value <= max) for value in answer)
+
+
+@register_check("min_sentences")
+def min_sentences_check(count: int) -> Check:
+    """
+    A free answer must have at least count sentences, counted by their dots.
+    """
+    return lambda answer: answer.count(".") >= count
+
+
+@register_check("min_length")
+def min_length_check(length: int) -> Check:
+    return lambda answer: len(answer) >= length
+
+
+@register_check("regex")
+def regex_check(pattern: str) -> Check:
+    """
+    A free answer must match the pattern somewhere.
+    """
+    compiled = re.compile(pattern)
+    return lambda answer: compiled.search(answer) is not None
+
+
+# the questionnaire used when no questions file is configured, and written as a template when the file is missing
+default_questions: List[Dict[str, Any]] = [
+    {
+        "name": "age",
+        "text": "How old are you? this will only be availiable from staff don't worry",
+        "type": "integer",
+        "label": "Age",
+        "checks": [{"kind": "count", "min": 1, "max": 1}, {"kind": "range", "min": 13, "max": 99}],
+        "error": "Please write your age, in numerical form, without any other number.",
+    },
+    {
+        "name": "read rules",
+        "text": "Did you fully read and understood the rules? (availiable in #rules)",
+        "type": "boolean",
+        "label": "Has read and understood rules?",
+        "refusal": "Unfortunately, we require any player to know our rules. Your application will not be transmitted. If this is a mistake, "
+        "start the whitelisting process again by sending me a new message.",
+    },
+    {
+        "name": "punishment",
+        "text": "Do you agree that, if you ever violate the rules, you will be punished or banned?",
+        "type": "boolean",
+        "label": "Has agreed to be punished/banned if they break the rules?",
+        "refusal": "Unfortunately, you have to accept that breaking a rule have consequences on the server. Your application will not be "
+        "transmitted. If this is a mistake, start the whitelisting process again by sending me a new message.",
+    },
+    {"name": "ban", "text": "Did you get ever banned? If yes please explain.", "type": "free", "label": "Ban history"},
+    {"name": "referal", "text": "Where did you heard of GT:NH?", "type": "free", "label": "Where did they hear about the pack"},
+    {
+        "name": "personality",
+        "text": "Please tell us a bit about yourself __**outside of Minecraft in minimum 3 sentences**__ (hobbies, personality..) ",
+        "type": "free",
+        "label": "A bit about theirselves (3 sentences min)",
+        "checks": [{"kind": "min_sentences", "count": 3}],
+        "error": "Looks like your text isn't at least 3 sentences. Friendly reminder: a sentence starts with a capital letter and ends with a dot.",
+    },
+]
+
+
+def compile_question(spec: Dict[str, Any]) -> Question:
+    """
+    Build a question from its definition.
+    :param spec: the definition, as found in the questions file
+    :return: the question
+    """
+    checks = []
+    for check in spec.get("checks", []):
+        params = dict(check)
+        kind = params.pop("kind", None)
+        if kind not in check_factories:
+            raise ValueError(f"question {spec.get('name')!r}: unknown check {kind!r}")
+        try:
+            checks.append(check_factories[kind](**params))
+        except TypeError as e:
+            raise ValueError(f"question {spec.get('name')!r}: invalid parameters for the check {kind!r}: {e}")
+
+    try:
+        return Question(
+            name=spec["name"],
+            text=spec["text"],
+            question_type=QuestionType(spec["type"]),
+            label=spec.get("label") or spec["name"],
+            checks=tuple(checks),
+            error=spec.get("error"),
+            refusal=spec.get("refusal"),
+        )
+    except KeyError as e:
+        raise ValueError(f"question {spec.get('name')!r}: missing {e}")
+
+
+# the keys of the json records that aren't answers
+reserved_names = {"author", *Application.fields}
+
+
+def compile_questions(specs: List[Dict[str, Any]]) -> List[Question]:
+    """
+    Build the questionnaire from its definition.
+    :param specs: the definitions of the questions, in order
+    :return: the questions, in order
+    """
+    questions = [compile_question(spec) for spec in specs]
+    names = [question.name for question in questions]
+    duplicates = {name for name in names if names.count(name) > 1}
+    if duplicates:
+        raise ValueError(f"duplicated questions: {', '.join(sorted(duplicates))}")
+    # the answers are stored next to the fields of the record, they can't share their names
+    reserved = set(names) & reserved_names
+    if reserved:
+        raise ValueError(f"reserved question names: {', '.join(sorted(reserved))}")
+    if len(questions) == 0:
+        raise ValueError("the questionnaire is empty")
+    return questions
+
+
+def load_questions(path: Path | None) -> List[Question]:
+    """
+    Load the questionnaire from a json file, writing the default one to it if it doesn't exist.
+    :param path: the path of the questions file, None to use the default questions
+    :return: the questions, in order
+    :raise ValueError: if the file isn't a valid questionnaire
+    """
+    if path is None:
+        return compile_questions(default_questions)
+    if not path.exists():
+        with open(path, "w") as file:
+            json.dump(default_questions, file, indent=4)
+        return compile_questions(default_questions)
+    with open(path, "r") as file:
+        specs = json.load(file)
+    if not isinstance(specs, list):
+        raise ValueError("the questions file must contain a list of questions")
+    return compile_questions(specs)
@@ -0,0 +1,60 @@
+import asyncio
+from typing import Dict, Tuple
+
+import discord
+
+
+class MessageRouter:
+    """
+    Routes the DMs of the users being interviewed to their interview.
+
+    Each open interview gets its own queue, indexed by (user id, DM channel id), so dispatching a message costs a
+    single dict lookup no matter how many interviews are running.
+    """
+
+    def __init__(self) -> None:
+        self.queues: Dict[Tuple[int, int], asyncio.Queue[discord.Message]] = dict()
+
+    def __len__(self) -> int:
+        return len(self.queues)
+
+    def open(self, user_id: int, channel_id: int) -> None:
+        """
+        Start routing the messages of a user in a channel.
+        :param user_id: the id of the user
+        :param channel_id: the id of the DM channel
+        :return: None
+        """
+        self.queues.setdefault((user_id, channel_id), asyncio.Queue())
+
+    def close(self, user_id: int, channel_id: int) -> None:
+        """
+        Stop routing the messages of a user in a channel.
+        :param user_id: the id of the user
+        :param channel_id: the id of the DM channel
+        :return: None
+        """
+        self.queues.pop((user_id, channel_id), None)
+
+    def dispatch(self, message: discord.Message) -> bool:
+        """
+        Give a message to the interview waiting for it, if any.
+        :param message: the message
+        :return: True if the message was routed to an interview
+        """
+        queue = self.queues.get((message.author.id, message.channel.id))
+        if queue is None:
+            return False
+        queue.put_nowait(message)
+        return True
+
+    async def next_message(self, user_id: int, channel_id: int, timeout: float) -> discord.Message:
+        """
+        Wait for the next message of a user in a channel.
+        :param user_id: the id of the user
+        :param channel_id: the id of the DM channel
+        :param timeout: maximum time to wait, in seconds
+        :return: the message
+        :raise asyncio.TimeoutError: if the user didn't answer in time
+        """
+        return await asyncio.wait_for(self.queues[(user_id, channel_id)].get(), timeout=timeout)
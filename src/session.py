@@ -0,0 +1,196 @@
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from src.application import Application
+from src.storage import JournalStore
+
+
+class InterviewSession:
+    """
+    State of an ongoing interview: the answers given so far, and the step the user is at.
+
+    Step 0 is the minecraft name, at step n the user answered n - 1 questions. The answers are kept under the names of
+    the questions, which tell the questions left to ask, even if the questionnaire changed since the checkpoint.
+    """
+
+    def __init__(self, user_id: int, channel_id: int, record: Application, step: int = 0, deadline: float = 0) -> None:
+        self.user_id: int = user_id
+        self.channel_id: int = channel_id
+        self.record: Application = record
+        self.step: int = step
+        self.deadline: float = deadline
+        self.admitted: bool = False
+        self.last_activity: float = time.monotonic()
+
+    def touch(self) -> None:
+        """
+        Record some activity on the session.
+        :return: None
+        """
+        self.last_activity = time.monotonic()
+
+    def advance(self, timeout: float) -> None:
+        """
+        Move to the next step once the current one has been answered.
+        :param timeout: time given to the user to answer the next step, in seconds
+        :return: None
+        """
+        self.step += 1
+        self.deadline = time.time() + timeout
+        self.touch()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"user_id": self.user_id, "channel_id": self.channel_id, "record": self.record.to_dict(), "step": self.step, "deadline": self.deadline}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "InterviewSession":
+        return cls(
+            user_id=data["user_id"], channel_id=data["channel_id"], record=Application.from_dict(data["record"]), step=data["step"], deadline=data["deadline"]
+        )
+
+
+def approximate_size(obj: Any) -> int:
+    """
+    Approximate the memory used by an object and everything it contains.
+    :param obj: a json-like object (dict, list, str, numbers...)
+    :return: the size in bytes
+    """
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(approximate_size(key) + approximate_size(value) for key, value in obj.items())
+    elif isinstance(obj, (list, tuple)):
+        size += sum(approximate_size(item) for item in obj)
+    return size
+
+
+class SessionRegistry:
+    """
+    The live sessions, at most one per user: a user who is already queued or being interviewed can't start another
+    interview.
+
+    A session leaves the registry through one of its lifecycle hooks (complete, abort, timeout). Sessions idle for
+    longer than idle_timeout are evicted as a safety net, and the registry never holds more than max_size sessions.
+    """
+
+    def __init__(self, max_size: int, idle_timeout: float) -> None:
+        self.max_size: int = max_size
+        self.idle_timeout: float = idle_timeout
+        self.sessions: Dict[int, InterviewSession] = dict()
+        self.lifecycle: Counter[str] = Counter()
+
+    def __len__(self) -> int:
+        return len(self.sessions)
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self.sessions
+
+    def get(self, user_id: int) -> Optional[InterviewSession]:
+        return self.sessions.get(user_id)
+
+    def start(self, session: InterviewSession) -> bool:
+        """
+        Register a new session.
+        :param session: the session
+        :return: False if the user already has a live session or if the registry is full, in which case the new one is
+        not registered
+        """
+        if session.user_id in self.sessions:
+            return False
+
+        if len(self.sessions) >= self.max_size:
+            self.evict_idle()
+            if len(self.sessions) >= self.max_size:
+                self.lifecycle["refused"] += 1
+                return False
+
+        session.touch()
+        self.sessions[session.user_id] = session
+        self.lifecycle["started"] += 1
+        return True
+
+    def end(self, user_id: int, reason: str) -> None:
+        """
+        Unregister the session of a user.
+        :param user_id: the id of the user
+        :param reason: why the session ended
+        :return: None
+        """
+        if self.sessions.pop(user_id, None) is not None:
+            self.lifecycle[reason] += 1
+
+    def complete(self, user_id: int) -> None:
+        self.end(user_id, "completed")
+
+    def abort(self, user_id: int) -> None:
+        self.end(user_id, "aborted")
+
+    def timeout(self, user_id: int) -> None:
+        self.end(user_id, "timed out")
+
+    def evict_idle(self) -> int:
+        """
+        Unregister the interviews that haven't seen any activity for longer than the idle timeout. Queued users are
+        expected to be idle, so they are kept.
+        :return: the number of evicted sessions
+        """
+        limit = time.monotonic() - self.idle_timeout
+        idle = [user_id for user_id, session in self.sessions.items() if session.admitted and session.last_activity < limit]
+        for user_id in idle:
+            self.end(user_id, "evicted")
+        return len(idle)
+
+    def counts(self) -> Dict[str, int]:
+        """
+        Count the live sessions.
+        :return: the total, the number of users waiting in the queue, and the number of users at each step
+        """
+        steps: Counter[str] = Counter(f"step {session.step}" for session in self.sessions.values() if session.admitted)
+        queued = sum(1 for session in self.sessions.values() if not session.admitted)
+        return {"live": len(self.sessions), "queued": queued, **dict(sorted(steps.items()))}
+
+    def memory_footprint(self) -> int:
+        """
+        Approximate the memory held by the live sessions.
+        :return: the size in bytes
+        """
+        return approximate_size(self.sessions) + sum(sys.getsizeof(session) + approximate_size(session.to_dict()) for session in self.sessions.values())
+
+
+class SessionStore:
+    """
+    Checkpoints of the ongoing interviews, so they can be resumed after a restart.
+
+    A checkpoint is a single journal line, so saving after every answer stays cheap.
+    """
+
+    def __init__(self, snapshot_path: Path, journal_path: Path, compact_every: int) -> None:
+        self.store = JournalStore(snapshot_path, journal_path, compact_every=compact_every)
+
+    def checkpoint(self, session: InterviewSession) -> None:
+        """
+        Save the current state of a session.
+        :param session: the session
+        :return: None
+        """
+        self.store.put(str(session.user_id), session.to_dict())
+
+    def discard(self, user_id: int) -> None:
+        """
+        Forget the checkpoint of a session that ended.
+        :param user_id: the id of the user of the session
+        :return: None
+        """
+        self.store.delete(str(user_id))
+
+    def load(self) -> List[InterviewSession]:
+        """
+        Load the sessions that were ongoing when the bot stopped.
+        :return: the sessions
+        """
+        return [InterviewSession.from_dict(data) for data in self.store.load().values()]
+
+    def close(self) -> None:
+        self.store.close()
@@ -0,0 +1,160 @@
+import asyncio
+import datetime
+import json
+import logging
+import os
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger("bot - stats")
+
+# (discord id, name, join timestamp)
+MemberRow = Tuple[int, str, float]
+
+# discord ids are snowflakes: the creation time of the account, in ms since the discord epoch, shifted by 22 bits
+discord_epoch_ms = 1420070400000
+percentiles = [10, 25, 50, 75, 90]
+
+
+def write_ndjson(path: Path, ids: np.ndarray, names: List[str], joined: np.ndarray, order: np.ndarray, chunk_size: int) -> None:
+    """
+    Write the member list ranked by join date, one [joined at, rank, name, id] array per line. The file is written
+    chunk by chunk and replaced atomically.
+    :param path: the path of the file
+    :param ids: the discord ids
+    :param names: the names
+    :param joined: the join timestamps
+    :param order: the indices of the members, sorted by join date
+    :param chunk_size: the number of lines formatted at once
+    :return: None
+    """
+    iso_dates = np.rint(joined * 1e6).astype(np.int64).astype("datetime64[us]").astype(str)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "w") as file:
+        for start in range(0, len(order), chunk_size):
+            file.writelines(
+                json.dumps([f"{iso_dates[i]}+00:00", rank, names[i], int(ids[i])]) + "\n"
+                for rank, i in enumerate(order[start : start + chunk_size].tolist(), start=start + 1)
+            )
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+
+
+def analyze(ids: np.ndarray, joined: np.ndarray, now: float) -> Dict[str, Any]:
+    """
+    Compute the join statistics of the members.
+    :param ids: the discord ids
+    :param joined: the join timestamps
+    :param now: the current timestamp
+    :return: the member count, the joins per month, the cohort sizes per year, and percentiles of the membership
+    duration and of the account age at join, in days
+    """
+    if len(joined) == 0:
+        return {"members": 0, "joins_per_month": {}, "cohorts": {}, "membership_days": {}, "account_age_at_join_days": {}}
+
+    instants = joined.astype("datetime64[s]")
+    months, month_counts = np.unique(instants.astype("datetime64[M]"), return_counts=True)
+    years, year_counts = np.unique(instants.astype("datetime64[Y]"), return_counts=True)
+
+    created = ((ids >> 22) + discord_epoch_ms) / 1000
+    membership_days = (now - joined) / 86400
+    account_age_days = (joined - created) / 86400
+
+    return {
+        "members": len(joined),
+        "joins_per_month": dict(zip(months.astype(str).tolist(), month_counts.tolist())),
+        "cohorts": dict(zip(years.astype(str).tolist(), year_counts.tolist())),
+        "membership_days": dict(zip(percentiles, np.percentile(membership_days, percentiles).round(1).tolist())),
+        "account_age_at_join_days": dict(zip(percentiles, np.percentile(account_age_days, percentiles).round(1).tolist())),
+    }
+
+
+def format_summary(summary: Dict[str, Any], months: int = 12) -> str:
+    """
+    Format the statistics for discord.
+    :param summary: the statistics, as returned by analyze
+    :param months: the number of months of the join histogram to show
+    :return: the message
+    """
+    lines = [f"members: {summary['members']}", "", "joins per month:"]
+    last_months = list(summary["joins_per_month"].items())[-months:]
+    peak = max([count for _, count in last_months], default=1)
+    lines += [f"  {month}: {count:>6} {'#' * round(20 * count / peak)}" for month, count in last_months]
+    lines += ["", "cohorts: " + ", ".join(f"{year}: {count}" for year, count in summary["cohorts"].items()), ""]
+    lines.append("membership (days): " + ", ".join(f"p{p}: {value}" for p, value in summary["membership_days"].items()))
+    lines.append("account age at join (days): " + ", ".join(f"p{p}: {value}" for p, value in summary["account_age_at_join_days"].items()))
+    return "```\n" + "\n".join(lines) + "\n```"
+
+
+class MemberStatsExport:
+    """
+    Export of the member list and of its statistics, built on a worker thread.
+
+    The event loop streams the members to the worker in chunks with feed(), so it never holds the loop for long. The
+    worker gathers them into columns, then sorts, writes and analyzes them with numpy once finish() is called.
+    """
+
+    def __init__(self, path: Path, chunk_size: int = 1000) -> None:
+        self.path: Path = path
+        self.chunk_size: int = chunk_size
+        self.chunks: "queue.Queue[Optional[List[MemberRow]]]" = queue.Queue()
+        self.aborted: bool = False
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="stats-export")
+        self.future = self.executor.submit(self.run)
+
+    def feed(self, rows: List[MemberRow]) -> None:
+        """
+        Give some members to the worker.
+        :param rows: the members
+        :return: None
+        """
+        self.chunks.put(rows)
+
+    async def finish(self) -> Dict[str, Any]:
+        """
+        Wait for the worker to write the file and compute the statistics, once all the members have been fed.
+        :return: the statistics, as returned by analyze, plus the time it took
+        """
+        self.chunks.put(None)
+        try:
+            return await asyncio.wrap_future(self.future)
+        finally:
+            self.executor.shutdown(wait=False)
+
+    def abort(self) -> None:
+        """
+        Stop the worker without writing anything.
+        :return: None
+        """
+        self.aborted = True
+        self.chunks.put(None)
+        self.executor.shutdown(wait=False)
+
+    def run(self) -> Dict[str, Any]:
+        start = time.perf_counter()
+        ids: List[int] = []
+        names: List[str] = []
+        joined: List[float] = []
+        while (rows := self.chunks.get()) is not None:
+            if len(rows) > 0:
+                chunk_ids, chunk_names, chunk_joined = zip(*rows)
+                ids.extend(chunk_ids)
+                names.extend(chunk_names)
+                joined.extend(chunk_joined)
+        if self.aborted:
+            return {}
+
+        id_array = np.array(ids, dtype=np.int64)
+        joined_array = np.array(joined, dtype=np.float64)
+        order = np.argsort(joined_array, kind="stable")
+        write_ndjson(self.path, id_array, names, joined_array, order, self.chunk_size)
+        summary = analyze(id_array, joined_array, datetime.datetime.now(datetime.timezone.utc).timestamp())
+        summary["duration"] = time.perf_counter() - start
+        logger.info(f"exported the statistics of {len(ids)} members in {summary['duration']:.2f}s")
+        return summary
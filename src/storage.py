@@ -0,0 +1,503 @@
+import asyncio
+import datetime
+import json
+import logging
+import os
+import sqlite3
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import IO, Any, Callable, Dict, List, Optional, Tuple, TypeVar
+
+from src.perf import metrics
+
+logger = logging.getLogger("bot - storage")
+
+T = TypeVar("T")
+
+
+def atomic_write_json(path: Path, data: Any) -> None:
+    """
+    Write some json data into a file, without ever leaving a partially written file behind.
+    :param path: the path of the file
+    :param data: the data to serialize
+    :return: None
+    """
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "w") as file:
+        json.dump(data, file)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+
+
+def log_future_error(future: "Future[Any]") -> None:
+    """
+    Done callback logging the exception of a background write, if any.
+    :param future: the future of the write
+    :return: None
+    """
+    error = future.exception()
+    if error is not None:
+        logger.error(f"background write failed: {error!r}")
+
+
+class JournalStore:
+    """
+    Storage engine keeping the records in a json snapshot, plus an append-only journal of the mutations made since
+    that snapshot. Every mutation is a single line appended to the journal, and the journal is folded into a new
+    snapshot once it gets long enough. All the disk writes happen in order on a single background thread.
+    """
+
+    def __init__(self, snapshot_path: Path, journal_path: Path, compact_every: int) -> None:
+        self.snapshot_path: Path = snapshot_path
+        self.journal_path: Path = journal_path
+        self.compact_every: int = compact_every
+        self.journal_length: int = 0
+        self.journal_file: Optional[IO[str]] = None
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="journal-store")
+
+    def load(self) -> Dict[str, Any]:
+        """
+        Rebuild the records by replaying the journal on top of the snapshot.
+        :return: the records
+        """
+        self.flush()
+        records, self.journal_length = self.read_records()
+        return records
+
+    def read(self) -> "Future[Dict[str, Any]]":
+        """
+        Read the records in the background, on the writer thread: after the queued writes, and never during a
+        compaction. Unlike load(), it leaves the count of the journal entries alone, so it can be used at any time.
+        :return: a future of the records
+        """
+        return self.executor.submit(lambda: self.read_records()[0])
+
+    def read_records(self) -> Tuple[Dict[str, Any], int]:
+        """
+        Read the snapshot and the journal from the disk.
+        :return: the records and the number of journal entries replayed
+        """
+        records: Dict[str, Any] = dict()
+        if self.snapshot_path.exists():
+            with open(self.snapshot_path, "r") as file:
+                records = json.load(file)
+
+        replayed = 0
+        if self.journal_path.exists():
+            with open(self.journal_path, "r") as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # a crash in the middle of an append leaves a truncated last line behind
+                        logger.warning(f"skipping a corrupted entry in {self.journal_path.name}")
+                        continue
+                    if entry["op"] == "set":
+                        records[entry["key"]] = entry["value"]
+                    elif entry["op"] == "del":
+                        records.pop(entry["key"], None)
+                    replayed += 1
+        return records, replayed
+
+    def put(self, key: str, value: Any) -> None:
+        """
+        Record that a key has been set to a value.
+        :param key: the key
+        :param value: the new value, serialized right away so later in-place changes aren't picked up
+        :return: None
+        """
+        self.append(json.dumps({"op": "set", "key": key, "value": value}))
+
+    def put_many(self, items: List[Tuple[str, Any]]) -> None:
+        """
+        Record that several keys have been set, with a single write.
+        :param items: the (key, value) pairs
+        :return: None
+        """
+        self.append("\n".join(json.dumps({"op": "set", "key": key, "value": value}) for key, value in items), len(items))
+
+    def delete(self, key: str) -> None:
+        """
+        Record that a key has been deleted.
+        :param key: the key
+        :return: None
+        """
+        self.append(json.dumps({"op": "del", "key": key}))
+
+    def delete_many(self, keys: List[str]) -> None:
+        """
+        Record that several keys have been deleted, with a single write.
+        :param keys: the keys
+        :return: None
+        """
+        self.append("\n".join(json.dumps({"op": "del", "key": key}) for key in keys), len(keys))
+
+    def append(self, line: str, entries: int = 1) -> None:
+        """
+        Queue journal lines for writing, and a compaction if the journal got too long.
+        :param line: the serialized journal entries
+        :param entries: the number of entries in the line
+        :return: None
+        """
+        self.executor.submit(self.write_line, line).add_done_callback(log_future_error)
+        self.journal_length += entries
+        if self.journal_length >= self.compact_every:
+            self.compact()
+
+    def write_line(self, line: str) -> None:
+        """
+        Append a line to the journal. Runs on the writer thread.
+        :param line: the serialized journal entry
+        :return: None
+        """
+        with metrics.timer("journal_append"):
+            if self.journal_file is None:
+                self.journal_file = open(self.journal_path, "a+")
+                # terminate a truncated last line so it doesn't swallow the new entry
+                if self.journal_file.tell() > 0:
+                    self.journal_file.seek(self.journal_file.tell() - 1)
+                    if self.journal_file.read(1) != "\n":
+                        self.journal_file.write("\n")
+            self.journal_file.write(line + "\n")
+            self.journal_file.flush()
+
+    def compact(self) -> None:
+        """
+        Queue the folding of the journal into a new snapshot.
+        :return: None
+        """
+        self.journal_length = 0
+        self.executor.submit(self.write_snapshot).add_done_callback(log_future_error)
+
+    def write_snapshot(self) -> None:
+        """
+        Fold the journal into a new snapshot, then truncate the journal. Runs on the writer thread.
+
+        If the process dies between the two steps, the journal is replayed again on top of the new snapshot on the next
+        startup, which gives the same records.
+        :return: None
+        """
+        with metrics.timer("store_compact"):
+            if self.journal_file is not None:
+                self.journal_file.close()
+                self.journal_file = None
+
+            records, _ = self.read_records()
+            atomic_write_json(self.snapshot_path, records)
+            with open(self.journal_path, "w"):
+                pass
+
+    def flush(self) -> None:
+        """
+        Block until every queued write is on the disk.
+        :return: None
+        """
+        self.executor.submit(lambda: None).result()
+
+    def close(self) -> None:
+        """
+        Write a final snapshot and stop the writer thread.
+        :return: None
+        """
+        self.compact()
+        self.executor.shutdown(wait=True)
+        if self.journal_file is not None:
+            self.journal_file.close()
+            self.journal_file = None
+
+
+def parse_application_date(date: Optional[str]) -> Optional[float]:
+    """
+    Convert the date of an application ("Oct 18 2023 21:04:12 GMT+1") into an epoch timestamp.
+    :param date: the date stored in the application
+    :return: the timestamp, or None if the date is missing or malformed
+    """
+    if date is None:
+        return None
+    try:
+        parsed = datetime.datetime.strptime(date.removesuffix(" GMT+1"), "%b %d %Y %H:%M:%S")
+    except ValueError:
+        return None
+    return parsed.replace(tzinfo=datetime.timezone(datetime.timedelta(hours=1))).timestamp()
+
+
+def application_time(record: Dict[str, Any]) -> Optional[float]:
+    """
+    Get the time an application was submitted at.
+    :param record: the record of the application
+    :return: the timestamp, or None if the application hasn't been submitted yet
+    """
+    submitted = record.get("timestamps", {}).get("submitted")
+    if submitted is not None:
+        return float(submitted)
+    # applications made before the timestamps were recorded only have a formatted date
+    return parse_application_date(record.get("date"))
+
+
+class SQLiteStore:
+    """
+    Storage engine keeping the records in a SQLite database, with indexes on the fields staff search by. The indexed
+    fields get their own columns, and the rest of the record (author, answers...) is kept in a json column.
+
+    The connection lives on a dedicated thread, so the queries never block the event loop.
+    """
+
+    indexed_fields = ("status", "uuid", "name")
+
+    def __init__(self, db_path: Path) -> None:
+        self.db_path: Path = db_path
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-store")
+        self.connection: Optional[sqlite3.Connection] = None
+        self.executor.submit(self.connect).result()
+
+    def connect(self) -> None:
+        """
+        Open the database and create the schema if needed. Runs on the database thread.
+        :return: None
+        """
+        self.connection = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.connection.executescript(
+            """
+            PRAGMA journal_mode = WAL;
+            PRAGMA synchronous = NORMAL;
+            CREATE TABLE IF NOT EXISTS applications (
+                discord_id TEXT PRIMARY KEY,
+                status TEXT,
+                uuid TEXT,
+                name TEXT COLLATE NOCASE,
+                applied_at REAL,
+                answers TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS applications_status ON applications (status);
+            CREATE INDEX IF NOT EXISTS applications_uuid ON applications (uuid);
+            CREATE INDEX IF NOT EXISTS applications_name ON applications (name);
+            CREATE INDEX IF NOT EXISTS applications_applied_at ON applications (applied_at);
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+            """
+        )
+
+    def run(self, function: Callable[[sqlite3.Connection], T]) -> "Future[T]":
+        """
+        Run a function on the database thread.
+        :param function: the function, receiving the connection
+        :return: a future of the result of the function
+        """
+
+        def wrapper() -> T:
+            assert self.connection is not None
+            with metrics.timer("sqlite_op"):
+                return function(self.connection)
+
+        return self.executor.submit(wrapper)
+
+    @staticmethod
+    def to_row(key: str, record: Dict[str, Any]) -> Tuple[Any, ...]:
+        """
+        Split a record into the columns of the applications table.
+        :param key: the discord id
+        :param record: the record
+        :return: the row
+        """
+        answers = {field: value for field, value in record.items() if field not in SQLiteStore.indexed_fields}
+        return key, record.get("status"), record.get("uuid"), record.get("name"), application_time(record), json.dumps(answers)
+
+    @staticmethod
+    def from_row(row: Tuple[Any, ...]) -> Tuple[str, Dict[str, Any]]:
+        """
+        Rebuild a record from a row of the applications table.
+        :param row: the row
+        :return: the discord id and the record
+        """
+        key, status, uuid, name, _, answers = row
+        record: Dict[str, Any] = json.loads(answers)
+        for field, value in zip(SQLiteStore.indexed_fields, (status, uuid, name)):
+            if value is not None:
+                record[field] = value
+        return key, record
+
+    def migrate_from_json(self, snapshot_path: Path, journal_path: Path) -> None:
+        """
+        Import the records of the json store, only the first time the database is opened.
+        :param snapshot_path: path of the json snapshot
+        :param journal_path: path of the json journal
+        :return: None
+        """
+
+        def migrate(connection: sqlite3.Connection) -> int:
+            if connection.execute("SELECT value FROM meta WHERE key = 'migrated_from_json'").fetchone() is not None:
+                return -1
+            records, _ = JournalStore(snapshot_path, journal_path, compact_every=0).read_records()
+            with connection:
+                connection.executemany("INSERT OR REPLACE INTO applications VALUES (?, ?, ?, ?, ?, ?)", [self.to_row(k, v) for k, v in records.items()])
+                connection.execute("INSERT INTO meta VALUES ('migrated_from_json', ?)", (str(snapshot_path),))
+            return len(records)
+
+        migrated = self.run(migrate).result()
+        if migrated >= 0:
+            logger.info(f"migrated {migrated} records from {snapshot_path.name} to {self.db_path.name}")
+
+    def load(self, status: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Read the records of the database.
+        :param status: only the records with this status, all of them if None
+        :return: the records
+        """
+        if status is None:
+            rows = self.run(lambda connection: connection.execute("SELECT * FROM applications").fetchall()).result()
+        else:
+            rows = self.run(lambda connection: connection.execute("SELECT * FROM applications WHERE status = ?", (status,)).fetchall()).result()
+        return dict(self.from_row(row) for row in rows)
+
+    def read(self) -> "Future[Dict[str, Any]]":
+        """
+        Read all the records in the background, after the queued writes.
+        :return: a future of the records
+        """
+        return self.run(lambda connection: dict(self.from_row(row) for row in connection.execute("SELECT * FROM applications").fetchall()))
+
+    def load_index(self) -> List[Tuple[str, Optional[str], Optional[str], Optional[str]]]:
+        """
+        Read the indexed fields of every record, without the rest of the records.
+        :return: a list of (discord id, status, uuid, name)
+        """
+        return self.run(lambda connection: connection.execute("SELECT discord_id, status, uuid, name FROM applications").fetchall()).result()
+
+    def lookup(self, key: str) -> "Future[Optional[Dict[str, Any]]]":
+        """
+        Read a single record in the background, after the queued writes.
+        :param key: the discord id
+        :return: a future of the record, or of None if there is no record for this discord id
+        """
+
+        def read(connection: sqlite3.Connection) -> Optional[Dict[str, Any]]:
+            row = connection.execute("SELECT * FROM applications WHERE discord_id = ?", (key,)).fetchone()
+            return None if row is None else self.from_row(row)[1]
+
+        return self.run(read)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Read a single record, after the queued writes. Blocks until it's read, see lookup() for the coroutines.
+        :param key: the discord id
+        :return: the record, or None if there is no record for this discord id
+        """
+        return self.lookup(key).result()
+
+    def put(self, key: str, value: Any) -> None:
+        """
+        Insert or replace a record, in the background.
+        :param key: the discord id
+        :param value: the record, serialized right away so later in-place changes aren't picked up
+        :return: None
+        """
+        row = self.to_row(key, value)
+
+        def write(connection: sqlite3.Connection) -> None:
+            with connection:
+                connection.execute("INSERT OR REPLACE INTO applications VALUES (?, ?, ?, ?, ?, ?)", row)
+
+        self.run(write).add_done_callback(log_future_error)
+
+    def put_many(self, items: List[Tuple[str, Any]]) -> None:
+        """
+        Insert or replace several records in a single transaction, in the background.
+        :param items: the (discord id, record) pairs
+        :return: None
+        """
+        rows = [self.to_row(key, value) for key, value in items]
+
+        def write(connection: sqlite3.Connection) -> None:
+            with connection:
+                connection.executemany("INSERT OR REPLACE INTO applications VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+        self.run(write).add_done_callback(log_future_error)
+
+    def delete(self, key: str) -> None:
+        """
+        Delete a record, in the background.
+        :param key: the discord id
+        :return: None
+        """
+
+        def write(connection: sqlite3.Connection) -> None:
+            with connection:
+                connection.execute("DELETE FROM applications WHERE discord_id = ?", (key,))
+
+        self.run(write).add_done_callback(log_future_error)
+
+    def delete_many(self, keys: List[str]) -> None:
+        """
+        Delete several records in a single transaction, in the background.
+        :param keys: the discord ids
+        :return: None
+        """
+        rows = [(key,) for key in keys]
+
+        def write(connection: sqlite3.Connection) -> None:
+            with connection:
+                connection.executemany("DELETE FROM applications WHERE discord_id = ?", rows)
+
+        self.run(write).add_done_callback(log_future_error)
+
+    async def query(
+        self,
+        status: Optional[str] = None,
+        uuid: Optional[str] = None,
+        name: Optional[str] = None,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        limit: Optional[int] = None,
+    ) -> List[Tuple[str, Dict[str, Any]]]:
+        """
+        Search the records using the indexes.
+        :param status: only the records with this status
+        :param uuid: only the records with this minecraft uuid
+        :param name: only the records with this minecraft name, case-insensitive
+        :param since: only the applications made after this timestamp
+        :param until: only the applications made before this timestamp
+        :param limit: maximum number of records returned, None for all of them
+        :return: a list of (discord id, record), most recent applications first
+        """
+        clauses: List[str] = []
+        parameters: List[Any] = []
+        for clause, value in (("status = ?", status), ("uuid = ?", uuid), ("name = ?", name), ("applied_at >= ?", since), ("applied_at < ?", until)):
+            if value is not None:
+                clauses.append(clause)
+                parameters.append(value)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        sql = f"SELECT * FROM applications {where} ORDER BY applied_at DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            parameters.append(limit)
+
+        rows = await asyncio.wrap_future(self.run(lambda connection: connection.execute(sql, parameters).fetchall()))
+        return [self.from_row(row) for row in rows]
+
+    def compact(self) -> None:
+        """
+        Checkpoint the write-ahead log into the database, in the background.
+        :return: None
+        """
+        self.run(lambda connection: connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")).add_done_callback(log_future_error)
+
+    def flush(self) -> None:
+        """
+        Block until every queued write is committed.
+        :return: None
+        """
+        self.executor.submit(lambda: None).result()
+
+    def close(self) -> None:
+        """
+        Commit the queued writes, close the database and stop its thread.
+        :return: None
+        """
+        self.compact()
+
+        def disconnect(connection: sqlite3.Connection) -> None:
+            connection.close()
+
+        self.run(disconnect).result()
+        self.executor.shutdown(wait=True)
+        self.connection = None
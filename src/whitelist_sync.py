@@ -0,0 +1,176 @@
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from src.application import Application, Status
+from src.storage import atomic_write_json, log_future_error
+
+logger = logging.getLogger("bot - whitelist sync")
+
+
+def dashed_uuid(uuid: str) -> str:
+    """
+    Format a minecraft uuid the way the servers write it in whitelist.json.
+    :param uuid: the uuid, with or without dashes
+    :return: the uuid with dashes
+    """
+    uuid = uuid.replace("-", "").lower()
+    return f"{uuid[:8]}-{uuid[8:12]}-{uuid[12:16]}-{uuid[16:20]}-{uuid[20:]}"
+
+
+def whitelist_entry(record: Application) -> Optional[Tuple[str, str]]:
+    """
+    Get the whitelist.json entry of an application.
+    :param record: the record of the application
+    :return: (uuid, name), or None if the player shouldn't be whitelisted
+    """
+    if record.status != Status.APPROVED or not record.uuid or not record.name:
+        return None
+    return dashed_uuid(record.uuid), record.name
+
+
+class WhitelistSync:
+    """
+    Keeps the whitelist.json of the minecraft servers in sync with the approved applications.
+
+    Only the records changed since the last write are diffed, and the entries that weren't added by the bot (e.g. the
+    staff whitelisted by hand) are left alone: the uuids written by the bot are kept in state_path, so it only removes
+    its own entries, even after a restart. The files are written atomically on a background thread. The servers only
+    read the file on startup or on `whitelist reload`.
+    """
+
+    def __init__(self, paths: List[Path], state_path: Optional[Path] = None) -> None:
+        self.paths: List[Path] = paths
+        self.state_path: Optional[Path] = state_path
+        # discord id -> (uuid, name) of the approved records
+        self.entries: Dict[str, Tuple[str, str]] = dict()
+        # same, as it was when the files were last written
+        self.written: Dict[str, Tuple[str, str]] = dict()
+        # uuid -> name, for each file
+        self.files: Dict[Path, Dict[str, str]] = dict()
+        # discord ids of the records changed since the last write
+        self.changed: Set[str] = set()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="whitelist-sync")
+
+    def read_file(self, path: Path) -> Dict[str, str]:
+        """
+        Read the entries of a whitelist.json.
+        :param path: the path of the file
+        :return: uuid -> name
+        """
+        if not path.exists():
+            return dict()
+        try:
+            with open(path, "r") as file:
+                return {dashed_uuid(entry["uuid"]): entry["name"] for entry in json.load(file)}
+        except (ValueError, KeyError, TypeError) as e:
+            logger.error(f"{path} is not a valid whitelist file, it will be overwritten: {e!r}")
+            return dict()
+
+    def read_state(self) -> Set[str]:
+        """
+        Read the uuids written by the bot before the last restart.
+        :return: the uuids, with dashes
+        """
+        if self.state_path is None or not self.state_path.exists():
+            return set()
+        try:
+            with open(self.state_path, "r") as file:
+                return {dashed_uuid(uuid) for uuid in json.load(file)}
+        except (ValueError, TypeError, AttributeError) as e:
+            logger.error(f"{self.state_path} is not valid, the entries written before won't be revoked: {e!r}")
+            return set()
+
+    def rebuild(self, records: Dict[str, Application]) -> None:
+        """
+        Rebuild all the files from the records: the approved players are added, and the players of the other records
+        are removed if the bot wrote them.
+        :param records: discord id -> record
+        :return: None
+        """
+        # the same bookkeeping as flush(): an entry the bot didn't write was added by hand, and stays
+        bot_written = {uuid for uuid, _ in self.written.values()} | self.read_state()
+        self.entries = dict()
+        revoked: Set[str] = set()
+        for key, record in records.items():
+            entry = whitelist_entry(record)
+            if entry is not None:
+                self.entries[key] = entry
+            elif record.uuid and dashed_uuid(record.uuid) in bot_written:
+                revoked.add(dashed_uuid(record.uuid))
+
+        self.files = dict()
+        for path in self.paths:
+            content = self.read_file(path)
+            for uuid in revoked:
+                content.pop(uuid, None)
+            content.update(self.entries.values())
+            self.files[path] = content
+
+        self.written = dict(self.entries)
+        self.changed = set()
+        self.write()
+
+    def track(self, key: str, record: Application | None) -> None:
+        """
+        Record the change of a record. It is written on the next flush.
+        :param key: the discord id of the record
+        :param record: the new record, or None if it was deleted
+        :return: None
+        """
+        entry = whitelist_entry(record) if record is not None else None
+        if self.entries.get(key) == entry:
+            return
+        if entry is None:
+            del self.entries[key]
+        else:
+            self.entries[key] = entry
+        self.changed.add(key)
+
+    def flush(self) -> None:
+        """
+        Apply the changes tracked since the last write to the files, and write them in the background.
+        :return: None
+        """
+        if len(self.changed) == 0:
+            return
+
+        for key in self.changed:
+            old = self.written.pop(key, None)
+            new = self.entries.get(key)
+            for content in self.files.values():
+                if old is not None and (new is None or old[0] != new[0]):
+                    content.pop(old[0], None)
+                if new is not None:
+                    content[new[0]] = new[1]
+            if new is not None:
+                self.written[key] = new
+        self.changed = set()
+        self.write()
+
+    def write(self) -> None:
+        """
+        Write all the files in the background.
+        :return: None
+        """
+        # copy the entries, the thread formats them while the loop keeps changing them
+        snapshots = {path: dict(content) for path, content in self.files.items()}
+        written = sorted({uuid for uuid, _ in self.written.values()})
+        self.executor.submit(self.write_files, snapshots, self.state_path, written).add_done_callback(log_future_error)
+
+    @staticmethod
+    def write_files(snapshots: Dict[Path, Dict[str, str]], state_path: Optional[Path], written: List[str]) -> None:
+        for path, content in snapshots.items():
+            atomic_write_json(path, [{"uuid": uuid, "name": name} for uuid, name in content.items()])
+        if state_path is not None:
+            atomic_write_json(state_path, written)
+
+    def close(self) -> None:
+        """
+        Write the pending changes and wait for the background writes.
+        :return: None
+        """
+        self.flush()
+        self.executor.shutdown(wait=True)